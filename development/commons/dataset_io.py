@@ -0,0 +1,229 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import ijson
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+import development.commons.env as env
+
+# ===== Constants =====
+PARQUET_SUFFIX = ".parquet"
+METADATA_KEY = b"dataset_metadata"
+ROW_GROUP_SIZE = 10000
+BATCH_SIZE = 1000
+FIELD_TYPES = {
+    "pmid": pa.string(),
+    "doi": pa.string(),
+    "title": pa.string(),
+    "author_list": pa.list_(pa.string()),
+    "abstract": pa.string(),
+    "publication_date": pa.string(),
+    "keyword_list": pa.list_(pa.string()),
+    "fragment_id": pa.int32(),
+    "number_of_fragments": pa.int32(),
+    "abstract_fragment": pa.string(),
+    "id": pa.string(),
+}
+# ===== Constants =====
+
+
+def dataset_path(json_path: str, format: str = env.DATASET_FORMAT) -> str:
+    """
+    Map the path of a dataset (as configured in env.py) to the file of the given format.
+    """
+    if format == "parquet":
+        return str(Path(json_path).with_suffix(PARQUET_SUFFIX))
+    if format == "json":
+        return json_path
+    raise ValueError(f"Invalid dataset format: {format}")
+
+
+def _normalize_value(value):
+    # Match the JSON datasets, which were written with `default=str`
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return str(value)
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, list):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
+def _create_schema(document, metadata):
+    fields = []
+    for key, value in document.items():
+        field_type = FIELD_TYPES.get(key)
+        if field_type is None:
+            field_type = pa.array([_normalize_value(value)]).type
+        fields.append(pa.field(key, field_type))
+    return pa.schema(fields, metadata={METADATA_KEY: json.dumps(metadata, default=str)})
+
+
+def write_parquet(path: str, documents, metadata: dict, row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Stream documents into a Parquet file. Only one row group is held in memory at a time.
+    :param path: The path of the Parquet file.
+    :param documents: An iterable of flat documents that all share the same keys.
+    :param metadata: Dataset level metadata (e.g. 'dataset_scraped_on'), stored in the file schema.
+    :param row_group_size: The number of documents per row group.
+    :return: The number of written documents.
+    """
+    writer = None
+    written = 0
+    rows = []
+
+    def flush():
+        nonlocal writer
+        if writer is None:
+            writer = pq.ParquetWriter(path, _create_schema(rows[0], metadata), compression="zstd")
+        writer.write_table(pa.Table.from_pylist(rows, schema=writer.schema))
+        rows.clear()
+
+    try:
+        for document in documents:
+            rows.append({key: _normalize_value(value) for key, value in document.items()})
+            written += 1
+            if len(rows) == row_group_size:
+                flush()
+        if len(rows) > 0:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # Keep the metadata of empty datasets
+        metadata = {METADATA_KEY: json.dumps(metadata, default=str)}
+        pq.write_table(pa.table({}).replace_schema_metadata(metadata), path)
+    return written
+
+
+def save_dataset(dataset: dict, json_path: str, format: str = env.DATASET_FORMAT) -> str:
+    """
+    Save a dataset ({<metadata>..., "documents": [...]}) in the configured format.
+    :param dataset: The dataset. Its documents may be any iterable when saving as Parquet.
+    :param json_path: The configured path of the dataset (see `dataset_path`).
+    :param format: "parquet" or "json".
+    :return: The path of the written file.
+    """
+    path = dataset_path(json_path, format)
+    folder_path = os.path.dirname(path)
+    if folder_path and not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    if format == "parquet":
+        metadata = {key: value for key, value in dataset.items() if key != "documents"}
+        write_parquet(path, dataset["documents"], metadata)
+    else:
+        with open(path, "w") as output:
+            json.dump({**dataset, "documents": list(dataset["documents"])}, output, indent=2, default=str)
+    return path
+
+
+def load_metadata(json_path: str, format: str = env.DATASET_FORMAT) -> dict:
+    """
+    Load the dataset level metadata without reading the documents.
+    """
+    path = dataset_path(json_path, format)
+    if format == "parquet":
+        schema_metadata = pq.read_schema(path).metadata or {}
+        return json.loads(schema_metadata.get(METADATA_KEY, b"{}"))
+
+    metadata = {}
+    with open(path, "rb") as input:
+        for prefix, event, value in ijson.parse(input):
+            if prefix == "documents":
+                break
+            if event in ("string", "number", "boolean", "null") and "." not in prefix:
+                metadata[prefix] = value
+    return metadata
+
+
+def count_documents(json_path: str, format: str = env.DATASET_FORMAT) -> int:
+    path = dataset_path(json_path, format)
+    if format == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    return sum(1 for _ in iter_documents(json_path, columns=[], format=format))
+
+
+def iter_document_batches(
+        json_path: str,
+        columns: list[str] = None,
+        batch_size: int = BATCH_SIZE,
+        format: str = env.DATASET_FORMAT,
+):
+    """
+    Stream the documents of a dataset in batches.
+    :param json_path: The configured path of the dataset (see `dataset_path`).
+    :param columns: Only read these fields (column projection). If None, all fields are read.
+    :param batch_size: The number of documents per batch.
+    :param format: "parquet" or "json".
+    :yield: Lists of documents (dicts).
+    """
+    path = dataset_path(json_path, format)
+    if format == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pylist()
+        return
+
+    with open(path, "rb") as input:
+        documents = ijson.items(input, "documents.item", use_float=True)
+        if columns is not None:
+            documents = ({key: document.get(key) for key in columns} for document in documents)
+        while batch := list(islice(documents, batch_size)):
+            yield batch
+
+
+def iter_documents(json_path: str, columns: list[str] = None, format: str = env.DATASET_FORMAT):
+    for batch in iter_document_batches(json_path, columns=columns, format=format):
+        yield from batch
+
+
+def load_documents(json_path: str, columns: list[str] = None, format: str = env.DATASET_FORMAT) -> list[dict]:
+    return list(iter_documents(json_path, columns=columns, format=format))
+
+
+def convert(json_path: str, source_format: str, target_format: str) -> str:
+    """
+    Convert a dataset between the JSON and the Parquet format.
+    """
+    print(f"[{datetime.datetime.now()}] Converting {dataset_path(json_path, source_format)} to {target_format}...")
+    dataset = {
+        **load_metadata(json_path, source_format),
+        "documents": tqdm(iter_documents(json_path, format=source_format), file=sys.stdout),
+    }
+    target_path = save_dataset(dataset, json_path, target_format)
+    print(f"[{datetime.datetime.now()}] Dataset successfully saved to {target_path}!")
+    return target_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert datasets between the JSON and the Parquet format.")
+    parser.add_argument("direction", choices=["to-parquet", "to-json"])
+    parser.add_argument("paths", nargs="*", default=[
+        env.CLEANED_DATASET_PATH,
+        env.DEDUPLICATED_DATASET_PATH,
+        env.ABSTRACTS_DATASET_PATH,
+        env.ABSTRACT_FRAGMENT_DATASET_PATH,
+    ], help="The configured (.json) paths of the datasets.")
+    args = parser.parse_args()
+
+    source_format, target_format = ("json", "parquet") if args.direction == "to-parquet" else ("parquet", "json")
+    for path in args.paths:
+        if os.path.exists(dataset_path(path, source_format)):
+            convert(path, source_format, target_format)
+        else:
+            print(f"[{datetime.datetime.now()}] Skipping {dataset_path(path, source_format)} (not found)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import numpy as np
+
+import development.commons.env as env
+
+# ===== Constants =====
+EMBEDDING_BACKENDS = ["sentence_transformer", "onnx", "onnx_int8"]
+ONNX_MODEL_FILE_NAME = "model.onnx"
+ONNX_INT8_MODEL_FILE_NAME = "model_int8.onnx"
+ONNX_CONFIG_FILE_NAME = "backend_config.json"
+ONNX_OPSET_VERSION = 14
+# ===== Constants =====
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale embeddings (a single one or a matrix with one per row) to unit length. The cosine similarity of
+    normalized embeddings is their dot product.
+    """
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class SentenceTransformerBackend:
+    """
+    The reference backend: the fp32 PyTorch SentenceTransformer.
+    """
+
+    def __init__(self, model_name: str = env.EMBEDDING_MODEL_NAME, normalize: bool = False):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.normalize = normalize
+        self.model = SentenceTransformer(model_name)
+        self.device = self.model.device
+
+    def to(self, device):
+        self.model.to(device)
+        self.device = self.model.device
+        return self
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=self.normalize, **kwargs)
+
+
+class OnnxBackend:
+    """
+    Runs the exported transformer with ONNX Runtime on the CPU and applies the pooling of the
+    SentenceTransformer in numpy. The int8 variant uses dynamically quantized weights.
+    """
+
+    def __init__(self, folder: str = env.ONNX_MODEL_FOLDER_PATH, quantized: bool = True, normalize: bool = False):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(folder, ONNX_CONFIG_FILE_NAME), "r") as input:
+            self.config = json.load(input)
+        model_file = ONNX_INT8_MODEL_FILE_NAME if quantized else ONNX_MODEL_FILE_NAME
+
+        self.name = f"{self.config['model_name']}#{'onnx_int8' if quantized else 'onnx'}"
+        self.device = "cpu (onnxruntime)"
+        self.normalize = normalize or self.config["normalize"]
+        self.tokenizer = AutoTokenizer.from_pretrained(folder)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(folder, model_file), providers=["CPUExecutionProvider"]
+        )
+
+    def _pool(self, hidden_states, attention_mask):
+        pooling = self.config["pooling"]
+        mask = attention_mask[:, :, None].astype(hidden_states.dtype)
+        if pooling == "mean":
+            return (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if pooling == "cls":
+            return hidden_states[:, 0]
+        if pooling == "max":
+            return np.where(mask > 0, hidden_states, -1e9).max(axis=1)
+        raise ValueError(f"Unsupported pooling mode: {pooling}")
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Encode a text or a list of texts, like `SentenceTransformer.encode`.
+        :raises TypeError: If an option of `SentenceTransformer.encode` is given that this backend does not support.
+        """
+        unsupported = {key: value for key, value in kwargs.items() if (key, value) != ("convert_to_numpy", True)}
+        if len(unsupported) > 0:
+            raise TypeError(f"Unsupported arguments of OnnxBackend.encode: {unsupported} "
+                            f"(normalization is configured on the backend, the output is always numpy)")
+
+        single_text = isinstance(texts, str)
+        if single_text:
+            texts = [texts]
+
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[i:i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.config["max_seq_length"],
+                return_tensors="np",
+            )
+            feed = {name: inputs[name].astype(np.int64) for name in self.config["input_names"]}
+            hidden_states = self.session.run(None, feed)[0]
+            embeddings.append(self._pool(hidden_states, inputs["attention_mask"]))
+
+        embeddings = np.concatenate(embeddings).astype(np.float32) if len(embeddings) > 0 \
+            else np.empty((0, env.EMBEDDING_DIMENSION), dtype=np.float32)
+        if self.normalize:
+            embeddings = normalize_embeddings(embeddings)
+        return embeddings[0] if single_text else embeddings
+
+
+def export_onnx(model_name: str = env.EMBEDDING_MODEL_NAME, folder: str = env.ONNX_MODEL_FOLDER_PATH):
+    """
+    Export the transformer of the SentenceTransformer to ONNX and quantize its weights to int8.
+    The tokenizer and the pooling configuration are saved next to the models.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    os.makedirs(folder, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model
+    transformer.eval()
+
+    inputs = model.tokenizer(["Export of the embedding model."], return_tensors="pt")
+    input_names = list(inputs.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    print(f"[{datetime.datetime.now()}] Exporting {model_name} to ONNX...")
+    model_path = os.path.join(folder, ONNX_MODEL_FILE_NAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dict(inputs),),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET_VERSION,
+        )
+
+    print(f"[{datetime.datetime.now()}] Quantizing the weights to int8...")
+    quantize_dynamic(model_path, os.path.join(folder, ONNX_INT8_MODEL_FILE_NAME), weight_type=QuantType.QInt8)
+
+    model.tokenizer.save_pretrained(folder)
+    with open(os.path.join(folder, ONNX_CONFIG_FILE_NAME), "w") as output:
+        json.dump({
+            "model_name": model_name,
+            "pooling": model[1].get_pooling_mode_str(),
+            "normalize": any(isinstance(module, Normalize) for module in model),
+            "max_seq_length": model.max_seq_length,
+            "input_names": input_names,
+        }, output, indent=2)
+    print(f"[{datetime.datetime.now()}] ONNX models saved to {folder}")
+
+
+def load_embedding_backend(backend: str = env.EMBEDDING_BACKEND, normalize: bool = env.NORMALIZE_EMBEDDINGS):
+    """
+    Load the configured embedding backend. The ONNX models are exported on first use.
+    :param backend: One of `EMBEDDING_BACKENDS`.
+    :param normalize: Return unit length embeddings.
+    :return: An object with an `encode` method that behaves like `SentenceTransformer.encode`
+    and a `name` that identifies the model and the backend.
+    """
+    if backend == "sentence_transformer":
+        return SentenceTransformerBackend(normalize=normalize)
+    if backend in ("onnx", "onnx_int8"):
+        if not os.path.exists(os.path.join(env.ONNX_MODEL_FOLDER_PATH, ONNX_CONFIG_FILE_NAME)):
+            export_onnx()
+        return OnnxBackend(quantized=backend == "onnx_int8", normalize=normalize)
+    raise ValueError(f"Invalid embedding backend: {backend}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (fp32 and int8).")
+    parser.add_argument("--model", default=env.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--folder", default=env.ONNX_MODEL_FOLDER_PATH)
+    args = parser.parse_args()
+    export_onnx(args.model, args.folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,71 @@
+import os
+
 # OpenSearch
 OPENSEARCH_HOST = "localhost"
 OPENSEARCH_PORT = 9200
 OPENSEARCH_AUTH = ('admin', 'admin')
 
-# Data Indices
+# Data Indices (read aliases; ingestion builds versioned indices "<alias>_v<n>" and swaps the alias when done)
 OPENSEARCH_ABSTRACT_FRAGMENT_INDEX = "abstract_fragments"
 OPENSEARCH_ABSTRACT_INDEX = "abstracts"
+INDEX_RETENTION = 2  # published versions kept per alias, including the live one
+VECTOR_INDEX_PROFILE = "nmslib_hnsw"  # kNN engine/space/graph parameters, see ingest/vector_index_profiles.py
 
 # Embedding
 EMBEDDING_MODEL_NAME = "pritamdeka/S-PubMedBert-MS-MARCO"
 EMBEDDING_MODEL_PATH = "development/ingest/data/embedding_model"
 EMBEDDING_DIMENSION = 768
+RANK_FUSION_METHOD = "rrf"  # fusion of the kNN and BM25 rankings: "rrf" (weighted reciprocal rank), "min_max" or "z_score"
+MULTI_QUERY_CONCURRENT = False  # send the sub-queries of the rank fusion as concurrent searches instead of one msearch
+MULTI_QUERY_WORKERS = 4  # threads of the concurrent mode of execute_multi_query (sub-queries of the rank fusion)
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # query embeddings in the process-wide LRU cache of the retrievers
+NORMALIZE_EMBEDDINGS = False  # store and query unit length embeddings, confidence by dot product (requires a re-ingest)
+EMBEDDING_BACKEND = "sentence_transformer"  # "sentence_transformer" (fp32 PyTorch), "onnx" or "onnx_int8" (quantized, CPU)
+ONNX_MODEL_FOLDER_PATH = "development/ingest/data/onnx_model"  # exported on first use of an onnx backend
+EMBEDDING_WORKERS = os.cpu_count() or 1  # worker processes of the CPU embedding engine (ingestion without accelerator)
+EMBEDDING_TOKEN_BUDGET = 8192  # padded tokens per batch of the CPU embedding engine
+EMBEDDING_CACHE_FOLDER_PATH = "development/ingest/data/embedding_cache"  # keyed by (model, text); delete to reset
 FRAGMENT_OVERLAP = 32
 TOKENS_PER_FRAGMENT = 256
+SPLIT_WORKERS = os.cpu_count() or 1  # processes that split abstracts into fragments
+PRUNE_TAIL_FRAGMENTS = True  # drop tail fragments inside the overlap of their predecessor, merge short ones into it
+MIN_TAIL_FRAGMENT_TOKENS = 64  # tail fragments with fewer tokens are merged into their predecessor
+MAX_MERGED_FRAGMENT_TOKENS = 320  # upper bound of a merged fragment (must fit max_seq_length of the model, 350)
+
+# Ingestion
+INGEST_BATCH_SIZE = 256  # fragments per pipeline batch (read -> embed -> serialize -> bulk); the CPU engine raises it to its input_batch_size()
+INGEST_QUEUE_DEPTH = 4  # batches buffered between two pipeline stages; bounds the peak memory
+BULK_LOAD_MODE = True  # no refreshes/replicas while loading, then restore, force-merge and warm up kNN
+BULK_WORKERS = 4  # concurrent bulk requests
+BULK_CHUNK_BYTES = 10 * 1024 * 1024  # maximum body size of a bulk request
+BULK_MAX_RETRIES = 5  # retries of documents rejected with HTTP 429
 
 # Language Model
 OLLAMA_MODEL_NAME = "mistral"
 OLLAMA_HOST = "localhost"
 OLLAMA_PORT = 11443
 
+# Entrez (PubMed E-utilities)
+ENTREZ_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"  # point to a local stand-in server for testing
+ENTREZ_EMAIL = "benedikt.vidic@gmx.de"
+ENTREZ_API_KEY = None  # NCBI allows 10 instead of 3 requests per second with an API key
+ENTREZ_REQUESTS_PER_SECOND = None  # None follows the NCBI limit for (no) API key
+ENTREZ_MAX_WORKERS = 4
+
 # Data Flow
+DATASET_FORMAT = "parquet"  # "parquet" (columnar, streamable) or "json"; parquet datasets replace the .json suffix
 ABSTRACTS_DATASET_PATH = "development/ingest/data/abstracts_dataset.json"
 ABSTRACT_FRAGMENT_DATASET_PATH = "development/ingest/data/abstract_fragment_dataset.json"
-RAW_DATASET_PATH = "development/scrape/data/raw_retrieved_dataset.pkl"
+RAW_SHARD_FOLDER_PATH = "development/scrape/data/raw_shards"
+EXTRACTION_BACKEND = "entrez"  # "entrez" (Bio.Entrez object trees) or "lxml" (streaming iterparse fast path)
+EXTRACTION_WORKERS = os.cpu_count() or 1  # 1 extracts the shards serially
 CLEANED_DATASET_PATH = "development/scrape/data/cleaned_retrieved_dataset.json"
+DEDUPLICATE_ABSTRACTS = False  # collapse near-duplicate abstracts (pubmed_deduplicator.py) before splitting them
+DEDUPLICATED_DATASET_PATH = "development/scrape/data/deduplicated_dataset.json"
+DUPLICATE_MAPPING_PATH = "development/scrape/data/duplicate_mapping.json"  # duplicate pmid -> canonical pmid
+DEDUPLICATION_JACCARD_THRESHOLD = 0.8  # estimated Jaccard similarity of the word shingles of near-duplicates
+DEDUPLICATION_WORKERS = os.cpu_count() or 1  # processes that compute the MinHash signatures
+INGEST_DATASET_PATH = DEDUPLICATED_DATASET_PATH if DEDUPLICATE_ABSTRACTS else CLEANED_DATASET_PATH  # input of the ingest scripts
 
 # Testing
 RAGAS_TESTSET_PATH = "development/evaluate/retrieval/testsets/ragas-testset.json"
@@ -0,0 +1,37 @@
+import numpy as np
+import orjson
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+
+# ===== Constants =====
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+# ===== Constants =====
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    A JSON serializer for the OpenSearch client based on orjson. Numpy arrays are encoded natively, without
+    converting them to lists of Python floats first, and float32 embeddings are written with the shortest
+    representation that round-trips in float32 (the precision OpenSearch stores) instead of 17 digits.
+    Dates and datetimes are encoded as ISO strings, like by the default serializer.
+    """
+
+    def default(self, data):
+        if isinstance(data, np.ndarray):
+            # orjson only encodes C-contiguous arrays of the exact ndarray type natively (no memmap or slices)
+            return np.ascontiguousarray(data)
+        return super().default(data)
+
+    def dumps(self, data) -> str:
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS).decode("utf-8")
+        except (TypeError, ValueError) as e:
+            raise SerializationError(data, e)
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
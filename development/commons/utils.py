@@ -3,6 +3,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 import development.commons.env as env
 from opensearchpy import OpenSearch
+from development.commons.serializer import OrjsonSerializer
 
 
 def get_opensearch_client():
@@ -13,4 +14,5 @@ def get_opensearch_client():
         verify_certs=False,
         ssl_assert_hostname=False,
         ssl_show_warn=False,
+        serializer=OrjsonSerializer(),
     )
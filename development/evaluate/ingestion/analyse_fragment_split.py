@@ -1,45 +1,102 @@
-import json
+import argparse
+import sys
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import development.commons.dataset_io as dataset_io
 import development.commons.env as env
+from development.ingest.fragment_splitter import FragmentSplitter
+
+# ===== Constants =====
+SHORT_FRAGMENT_WORDS = 50
+# ===== Constants =====
 
 
 def is_short_last_fragment(document):
     return (
         document["fragment_id"] == document["number_of_fragments"] - 1
         and document["fragment_id"] != 0
-        and len(document["abstract_fragment"].split()) < 50
+        and len(document["abstract_fragment"].split()) < SHORT_FRAGMENT_WORDS
     )
 
 
-def find_document_by_id(abstract_id, fragment_id, documents):
-    for doc in documents:
-        if doc["pmid"] == abstract_id and doc["fragment_id"] == fragment_id:
-            return doc
-    raise "Error, document not found"
-    return None
+def find_redundant_fragments(documents):
+    """
+    Find the short last fragments whose text is contained in the previous fragment of the same abstract.
+    The fragments are looked up by (pmid, fragment_id), so the analysis is linear in the number of fragments.
+    :return: The short last fragments and the redundant ones among them.
+    """
+    fragments_by_id = {(document["pmid"], document["fragment_id"]): document for document in documents}
+
+    short_documents = list(filter(is_short_last_fragment, documents))
+    unnecessary_documents = []
+    for document in short_documents:
+        previous_fragment = fragments_by_id.get((document["pmid"], document["fragment_id"] - 1))
+        if previous_fragment is None:
+            raise KeyError(f"Fragment {document['fragment_id'] - 1} of abstract {document['pmid']} not found")
+        if document["abstract_fragment"] in previous_fragment["abstract_fragment"]:
+            unnecessary_documents.append(document)
+    return short_documents, unnecessary_documents
+
+
+def analyse_document_fragments():
+    all_documents = dataset_io.load_documents(
+        env.ABSTRACT_FRAGMENT_DATASET_PATH,
+        columns=["pmid", "fragment_id", "number_of_fragments", "abstract_fragment"],
+    )
+    short_documents, unnecessary_documents = find_redundant_fragments(all_documents)
 
+    print(f"Fragment dataset: {len(all_documents)} fragments")
+    print(f"  short last fragments (< {SHORT_FRAGMENT_WORDS} words): {len(short_documents)}")
+    print(f"  contained in their previous fragment: {len(unnecessary_documents)}")
 
-def analyseDocumentFragments():
-    with open(env.ABSTRACT_FRAGMENT_DATASET_PATH, "r", encoding="utf-8") as file:
-        data = json.load(file)
 
-    all_documents = data["documents"]
-    total_number_documents = len(all_documents)
+def compare_pruning(number_of_abstracts: int = None):
+    """
+    Split the cleaned dataset with and without tail pruning and report the vectors the pruning saves.
+    """
+    documents = dataset_io.iter_documents(env.INGEST_DATASET_PATH, columns=["abstract"])
+    abstracts = [document["abstract"] for document in islice(documents, number_of_abstracts)]
 
-    print(total_number_documents)
+    unpruned = FragmentSplitter(prune_tail_fragments=False).split_texts(abstracts)
+    pruned = FragmentSplitter(prune_tail_fragments=True).split_texts(abstracts)
 
-    short_documents = list(filter(is_short_last_fragment, all_documents))
+    dropped = 0
+    merged = 0
+    for unpruned_fragments, pruned_fragments in zip(unpruned, pruned):
+        if len(pruned_fragments) == len(unpruned_fragments):
+            continue
+        if pruned_fragments[-1] == unpruned_fragments[-2]:
+            dropped += 1
+        else:
+            merged += 1
 
-    print(len(short_documents))
+    number_unpruned = sum(len(fragments) for fragments in unpruned)
+    number_pruned = sum(len(fragments) for fragments in pruned)
+    saved = number_unpruned - number_pruned
+    print(f"Pruning ({len(abstracts)} abstracts, min tail {env.MIN_TAIL_FRAGMENT_TOKENS} tokens, "
+          f"max merged {env.MAX_MERGED_FRAGMENT_TOKENS} tokens):")
+    print(f"  fragments without pruning: {number_unpruned}")
+    print(f"  fragments with pruning:    {number_pruned}")
+    print(f"  dropped tails (inside the overlap): {dropped}")
+    print(f"  merged tails: {merged}")
+    print(f"  saved vectors: {saved} ({saved / max(number_unpruned, 1):.2%}, "
+          f"{saved * env.EMBEDDING_DIMENSION * 4 / 1024 ** 2:.1f} MB of float32 embeddings)")
 
-    unnecessary_documents = []
-    for document in short_documents:
-        previous_fragment = find_document_by_id(
-            document["pmid"], document["fragment_id"] - 1, all_documents
-        )
-        if document["abstract_fragment"] in previous_fragment["abstract_fragment"]:
-            unnecessary_documents.append(document)
 
-    print(len(unnecessary_documents))
+def main():
+    parser = argparse.ArgumentParser(description="Analyse redundant fragments and the savings of tail pruning.")
+    parser.add_argument("--abstracts", type=int, default=None,
+                        help="Number of cleaned abstracts to split for the pruning report (default: all).")
+    parser.add_argument("--skip-pruning-report", action="store_true")
+    args = parser.parse_args()
+
+    analyse_document_fragments()
+    if not args.skip_pruning_report:
+        compare_pruning(args.abstracts)
 
 
-analyseDocumentFragments()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+import development.commons.dataset_io as dataset_io
+import development.commons.env as env
+from development.ingest.embedding_engine import CpuEmbeddingEngine
+
+
+def load_fragments(number_of_fragments: int) -> list[str]:
+    documents = dataset_io.iter_documents(env.ABSTRACT_FRAGMENT_DATASET_PATH, columns=["abstract_fragment"])
+    return [document["abstract_fragment"] for document in islice(documents, number_of_fragments)]
+
+
+def benchmark_baseline(fragments: list[str]) -> dict:
+    """
+    The previous behaviour: one process, all cores for torch, fixed batches of 100.
+    """
+    model = SentenceTransformer(env.EMBEDDING_MODEL_NAME, device="cpu")
+    start = time.perf_counter()
+    embeddings = model.encode(fragments, batch_size=100, convert_to_numpy=True)
+    elapsed = time.perf_counter() - start
+    return {"name": "baseline", "seconds": elapsed, "embeddings": embeddings}
+
+
+def benchmark_engine(fragments: list[str], workers: int, token_budget: int) -> dict:
+    with CpuEmbeddingEngine(workers=workers, token_budget=token_budget) as engine:
+        # Load the model in every worker before measuring
+        engine.encode(fragments[:workers])
+        start = time.perf_counter()
+        embeddings = engine.encode(fragments)
+        elapsed = time.perf_counter() - start
+    return {"name": f"{workers} workers", "seconds": elapsed, "embeddings": embeddings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of the CPU embedding engine.")
+    parser.add_argument("--fragments", type=int, default=2000, help="Embed the first N fragments of the dataset.")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    parser.add_argument("--token-budget", type=int, default=env.EMBEDDING_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    fragments = load_fragments(args.fragments)
+    print(f"Embedding {len(fragments)} fragments with {env.EMBEDDING_MODEL_NAME} "
+          f"({os.cpu_count()} cores, {torch.get_num_threads()} torch threads)...")
+
+    baseline = benchmark_baseline(fragments)
+    results = [baseline] + [benchmark_engine(fragments, workers, args.token_budget) for workers in args.workers]
+
+    print(f"{'run':<12}{'seconds':>10}{'fragments/s':>14}{'speedup':>10}{'min cosine':>12}")
+    reference = baseline["embeddings"] / np.linalg.norm(baseline["embeddings"], axis=1, keepdims=True)
+    for result in results:
+        # The engine must return the same embeddings in the same order as the baseline
+        embeddings = result["embeddings"] / np.linalg.norm(result["embeddings"], axis=1, keepdims=True)
+        min_cosine = np.min(np.sum(reference * embeddings, axis=1))
+        print(f"{result['name']:<12}{result['seconds']:>10.2f}{len(fragments) / result['seconds']:>14.1f}"
+              f"{baseline['seconds'] / result['seconds']:>10.2f}{min_cosine:>12.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+from opensearchpy.serializer import JSONSerializer
+
+import development.commons.dataset_io as dataset_io
+import development.commons.env as env
+from development.commons.serializer import OrjsonSerializer
+
+# ===== Constants =====
+EMBEDDING_FIELD = "abstract_fragment_embedding"
+BENCHMARK_INDEX = "serializer_benchmark"
+# ===== Constants =====
+
+
+def load_documents(number_of_documents: int) -> list[dict]:
+    """
+    Fragments of the dataset with random float32 embeddings, as they leave the embed stage of the ingestion.
+    """
+    documents = list(islice(dataset_io.iter_documents(env.ABSTRACT_FRAGMENT_DATASET_PATH), number_of_documents))
+    embeddings = np.random.default_rng(0).standard_normal((len(documents), env.EMBEDDING_DIMENSION), dtype=np.float32)
+    for document, embedding in zip(documents, embeddings):
+        document[EMBEDDING_FIELD] = embedding
+    return documents
+
+
+def benchmark(serializer, documents: list[dict], repeats: int) -> dict:
+    """
+    Serialize the bulk lines (action and source) of the documents like `serialize_bulk_data`.
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        lines = [
+            (serializer.dumps({"create": {"_index": BENCHMARK_INDEX, "_id": document["id"]}}), serializer.dumps(document))
+            for document in documents
+        ]
+        seconds.append(time.perf_counter() - start)
+
+    size = sum(len(action.encode("utf-8")) + len(source.encode("utf-8")) + 2 for action, source in lines)
+    best = min(seconds)
+    return {
+        "serializer": type(serializer).__name__,
+        "documents_per_second": len(documents) / best,
+        "mb_per_second": size / 1024 ** 2 / best,
+        "bytes_per_document": size / len(documents),
+    }
+
+
+def check_round_trip(documents: list[dict]):
+    """
+    The embeddings must survive the float32 precision of the orjson serializer exactly.
+    """
+    serializer = OrjsonSerializer()
+    for document in documents[:100]:
+        vector = np.array(serializer.loads(serializer.dumps(document))[EMBEDDING_FIELD], dtype=np.float32)
+        if not np.array_equal(vector, document[EMBEDDING_FIELD]):
+            raise AssertionError(f"Embedding of {document['id']} changed during serialization")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the throughput of the OpenSearch JSON serializers.")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = load_documents(args.documents)
+    check_round_trip(documents)
+    results = [benchmark(serializer, documents, args.repeats) for serializer in (JSONSerializer(), OrjsonSerializer())]
+
+    print(f"Serializing {len(documents)} fragments with {env.EMBEDDING_DIMENSION}-dimensional embeddings:")
+    print(f"{'serializer':<20}{'docs/s':>10}{'MB/s':>10}{'bytes/doc':>11}")
+    for result in results:
+        print(f"{result['serializer']:<20}{result['documents_per_second']:>10.0f}{result['mb_per_second']:>10.1f}"
+              f"{result['bytes_per_document']:>11.0f}")
+    print(f"Speedup: {results[1]['documents_per_second'] / results[0]['documents_per_second']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
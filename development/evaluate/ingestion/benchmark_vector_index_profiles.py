@@ -0,0 +1,171 @@
+import argparse
+import datetime
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+from opensearchpy import helpers
+from opensearchpy.exceptions import NotFoundError
+
+import development.commons.env as env
+import development.commons.utils as utils
+import development.ingest.vector_index_profiles as vector_index_profiles
+from development.commons.embedding_backend import load_embedding_backend
+from development.ingest.bulk_loader import BulkLoader, serialize_bulk_data
+
+# ===== Constants =====
+BENCHMARK_INDEX_PREFIX = "knn_benchmark_"
+EMBEDDING_FIELD = "abstract_fragment_embedding"
+# ===== Constants =====
+
+
+def load_vectors(client, number_of_vectors: int) -> tuple[list[str], np.ndarray]:
+    """
+    Read a sample of fragment embeddings from the live index, so the benchmark needs no embedding model for them.
+    """
+    hits = helpers.scan(
+        client,
+        index=env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX,
+        query={"query": {"match_all": {}}},
+        _source_includes=[EMBEDDING_FIELD],
+        size=1000,
+    )
+    ids = []
+    vectors = []
+    for hit in islice(hits, number_of_vectors):
+        ids.append(hit["_id"])
+        vectors.append(hit["_source"][EMBEDDING_FIELD])
+    return ids, np.array(vectors, dtype=np.float32)
+
+
+def load_query_vectors(number_of_queries: int) -> np.ndarray:
+    with open(env.RETRIEVAL_TESTSET_PATH, "r") as input:
+        questions = [question["question"] for question in json.load(input)["questions"][:number_of_queries]]
+    return np.asarray(load_embedding_backend().encode(questions), dtype=np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    # The ground truth is the exact cosine search, which the original index approximates
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    similarities = query_vectors @ vectors.T
+    return np.argsort(-similarities, axis=1)[:, :k]
+
+
+def delete_index(client, index_name: str):
+    try:
+        client.indices.delete(index=index_name)
+    except NotFoundError:
+        pass
+
+
+def load_index(client, index_name: str, ids: list[str], vectors: np.ndarray):
+    documents = [{"id": _id, EMBEDDING_FIELD: vector} for _id, vector in zip(ids, vectors)]
+    with BulkLoader(client) as loader:
+        for i in range(0, len(documents), env.INGEST_BATCH_SIZE):
+            loader.add(serialize_bulk_data(client, documents[i:i + env.INGEST_BATCH_SIZE], index_name, id_field="id"))
+    client.indices.refresh(index=index_name)
+
+
+def create_index(client, index_name: str, field_mapping: dict, settings: dict):
+    delete_index(client, index_name)
+    client.indices.create(index=index_name, body={
+        "settings": {"number_of_shards": 1, "number_of_replicas": 0, "index.knn": True, **settings},
+        "mappings": {"properties": {"id": {"type": "keyword"}, EMBEDDING_FIELD: field_mapping}},
+    })
+
+
+def native_memory_kb(client, index_name: str) -> float:
+    stats = client.transport.perform_request("GET", "/_plugins/_knn/stats")
+    return sum(
+        node.get("indices_in_cache", {}).get(index_name, {}).get("graph_memory_usage", 0)
+        for node in stats["nodes"].values()
+    )
+
+
+def benchmark_profile(client, profile_name: str, ids, vectors, query_vectors, exact, k: int, keep: bool) -> dict:
+    index_name = f"{BENCHMARK_INDEX_PREFIX}{profile_name}"
+    profile = vector_index_profiles.get_profile(profile_name)
+    print(f"[{datetime.datetime.now()}] Benchmarking profile {profile_name}...")
+
+    start = time.perf_counter()
+    if profile.get("train"):
+        # Train the quantizer on the sample, in an index without quantization
+        training_index = f"{index_name}_training"
+        create_index(client, training_index, {"type": "knn_vector", "dimension": env.EMBEDDING_DIMENSION}, {})
+        load_index(client, training_index, ids, vectors)
+        knn_model_id = vector_index_profiles.train_model(
+            client, profile_name, training_index, EMBEDDING_FIELD, len(ids), knn_model_id=f"{index_name}_model")
+        delete_index(client, training_index)
+        field_mapping = {"type": "knn_vector", "model_id": knn_model_id}
+    else:
+        field_mapping = vector_index_profiles.knn_field_mapping(client, profile_name)
+
+    create_index(client, index_name, field_mapping, vector_index_profiles.knn_index_settings(profile_name))
+    load_index(client, index_name, ids, vectors)
+    client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=3600)
+    build_seconds = time.perf_counter() - start
+
+    client.transport.perform_request("GET", f"/_plugins/_knn/warmup/{index_name}")
+    size_bytes = client.indices.stats(index=index_name)["_all"]["primaries"]["store"]["size_in_bytes"]
+    memory_kb = native_memory_kb(client, index_name)
+
+    latencies = []
+    recalls = []
+    for query_vector, exact_indices in zip(query_vectors, exact):
+        query = {"knn": {EMBEDDING_FIELD: {"vector": query_vector, "k": k}}}
+        query_start = time.perf_counter()
+        response = client.search(index=index_name, body={"size": k, "query": query}, _source=False)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+        retrieved = {hit["_id"] for hit in response["hits"]["hits"]}
+        recalls.append(len(retrieved & {ids[i] for i in exact_indices}) / k)
+
+    if not keep:
+        delete_index(client, index_name)
+
+    return {
+        "profile": profile_name,
+        "build_seconds": build_seconds,
+        "size_mb": size_bytes / 1024 ** 2,
+        "native_memory_mb": memory_kb / 1024,
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+        "recall": float(np.mean(recalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build every vector index profile and compare them.")
+    parser.add_argument("--profiles", nargs="+", default=list(vector_index_profiles.VECTOR_INDEX_PROFILES))
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of fragment embeddings to index.")
+    parser.add_argument("--queries", type=int, default=500, help="Number of testset questions to query.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark indices.")
+    args = parser.parse_args()
+
+    client = utils.get_opensearch_client()
+    ids, vectors = load_vectors(client, args.vectors)
+    query_vectors = load_query_vectors(args.queries)
+    exact = exact_top_k(vectors, query_vectors, args.k)
+    print(f"Benchmarking {args.profiles} with {len(ids)} vectors and {len(query_vectors)} queries (k={args.k})...")
+
+    results = [
+        benchmark_profile(client, profile, ids, vectors, query_vectors, exact, args.k, args.keep)
+        for profile in args.profiles
+    ]
+
+    print(f"{'profile':<14}{'build (s)':>10}{'size (MB)':>11}{'native (MB)':>13}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          f"{f'recall@{args.k}':>11}")
+    for result in results:
+        print(f"{result['profile']:<14}{result['build_seconds']:>10.1f}{result['size_mb']:>11.1f}"
+              f"{result['native_memory_mb']:>13.1f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+              f"{result['recall']:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+from tqdm import tqdm
+
+import development.commons.env as env
+from development.retrieve.opensearch_connector import (
+    create_knn_query,
+    create_multi_match_BM25_query,
+    execute_multi_query,
+    execute_query,
+)
+from development.retrieve.query_context import QueryContext
+from development.retrieve.retrieval_wrapper import MATCH_ON_FIELDS
+
+# ===== Constants =====
+SUB_QUERY_NAMES = ["knn", "bm25"]
+MODES = ["sequential", "msearch", "concurrent"]
+# ===== Constants =====
+
+
+def load_questions(number_of_questions: int) -> list[str]:
+    with open(env.RETRIEVAL_TESTSET_PATH, "r") as input:
+        return [question["question"] for question in json.load(input)["questions"][:number_of_questions]]
+
+
+def run(mode: str, queries: list, size: int) -> tuple[list[dict], list[float]]:
+    if mode == "sequential":
+        # The previous behaviour of the rank fusion: one search request after the other
+        responses, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            responses.append(execute_query(query, index=env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX, size=size))
+            timings.append((time.perf_counter() - start) * 1000)
+        return responses, timings
+    return execute_multi_query(queries, index=env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX, size=size,
+                               concurrent=mode == "concurrent")
+
+
+def hit_ids(responses: list[dict]) -> list[list[str]]:
+    return [[hit["_id"] for hit in response["hits"]["hits"]] for response in responses]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the execution modes of the sub-queries of the rank fusion.")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--size", type=int, default=10)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    latencies = {mode: [] for mode in MODES}
+    sub_query_timings = {mode: [] for mode in MODES}
+    mismatches = 0
+
+    for question in tqdm(questions, file=sys.stdout):
+        # Encode outside of the measurement, so only the search requests are compared
+        context = QueryContext(question)
+        queries = [
+            create_knn_query(question, k=args.size, context=context),
+            create_multi_match_BM25_query(question, MATCH_ON_FIELDS),
+        ]
+        results = {}
+        for mode in MODES:
+            start = time.perf_counter()
+            responses, timings = run(mode, queries, args.size)
+            latencies[mode].append((time.perf_counter() - start) * 1000)
+            sub_query_timings[mode].append(timings)
+            results[mode] = hit_ids(responses)
+        mismatches += int(any(results[mode] != results["sequential"] for mode in MODES))
+
+    print(f"Sub-queries of {len(questions)} questions (size {args.size}):")
+    print(f"{'mode':<12}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          + "".join(f"{f'{name} (ms)':>12}" for name in SUB_QUERY_NAMES))
+    for mode in MODES:
+        mean_timings = np.mean(sub_query_timings[mode], axis=0)
+        print(f"{mode:<12}{np.percentile(latencies[mode], 50):>10.2f}{np.percentile(latencies[mode], 99):>10.2f}"
+              + "".join(f"{timing:>12.2f}" for timing in mean_timings))
+    print("Sub-query timings: client side for sequential and concurrent, server side (took) for msearch.")
+    print(f"Questions with different hits across the modes: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
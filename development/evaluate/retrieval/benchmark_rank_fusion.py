@@ -0,0 +1,94 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+from langchain.retrievers import EnsembleRetriever
+
+import development.commons.env as env
+import development.retrieve.rank_fusion as rank_fusion
+from development.retrieve.retrieval_wrapper import (
+    AbstractFragmentOpenSearch,
+    CustomOpensearchAbstractFragmentRetriever,
+    convert_abstract_fragments_to_langchain_documents,
+    convert_langchain_documents_to_abstract_fragments,
+)
+
+
+def create_hits(size: int, overlap: int, generator) -> list[list[dict]]:
+    """
+    Two synthetic responses (kNN and BM25) of `size` fragments, of which `overlap` appear in both.
+    """
+    def hit(number: int) -> dict:
+        return {
+            "_id": f"{number}_0",
+            "_score": float(generator.random()),
+            "_source": {
+                "abstract_fragment": f"fragment {number} " * 50,
+                "pmid": str(number),
+                "title": f"title {number}",
+                "author_list": ["author"],
+                "keyword_list": ["keyword"],
+                "number_of_fragments": 1,
+                "fragment_id": 0,
+                "ingested_at": "2024-01-01T00:00:00",
+                "publication_date": "2024-01-01",
+                "id": f"{number}_0",
+                "abstract_fragment_embedding": generator.random(env.EMBEDDING_DIMENSION).tolist(),
+                "doi": "",
+            },
+        }
+
+    knn = [hit(number) for number in range(size)]
+    bm25 = [hit(number) for number in range(size - overlap, 2 * size - overlap)]
+    return [knn, bm25]
+
+
+def fuse_with_ensemble_retriever(hit_lists, weight):
+    # The previous implementation: pydantic models -> langchain documents -> EnsembleRetriever -> pydantic models
+    dummy_retriever = CustomOpensearchAbstractFragmentRetriever()
+    ensemble_retriever = EnsembleRetriever(weights=[weight, 1 - weight], retrievers=[dummy_retriever, dummy_retriever])
+    fragments_list = [
+        convert_abstract_fragments_to_langchain_documents([AbstractFragmentOpenSearch(**hit["_source"]) for hit in hits])
+        for hits in hit_lists
+    ]
+    documents = ensemble_retriever.weighted_reciprocal_rank(fragments_list)
+    return convert_langchain_documents_to_abstract_fragments(documents)
+
+
+def fuse_with_rank_fusion(hit_lists, weight):
+    fused_hits = rank_fusion.fuse_hits(hit_lists, weights=[weight, 1 - weight])
+    return [AbstractFragmentOpenSearch(**hit["_source"]) for hit in fused_hits]
+
+
+def benchmark(fuse, hit_lists, weight, repeats: int) -> np.ndarray:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fuse(hit_lists, weight)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the overhead of the rank fusion implementations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 10, 24, 100])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--weight", type=float, default=0.5)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(0)
+    print(f"{'size':>6}{'ensemble p50 (ms)':>20}{'rank_fusion p50 (ms)':>23}{'speedup':>10}")
+    for size in args.sizes:
+        hit_lists = create_hits(size, size // 2, generator)
+        baseline = benchmark(fuse_with_ensemble_retriever, hit_lists, args.weight, args.repeats)
+        fused = benchmark(fuse_with_rank_fusion, hit_lists, args.weight, args.repeats)
+        print(f"{size:>6}{np.median(baseline):>20.3f}{np.median(fused):>23.3f}"
+              f"{np.median(baseline) / np.median(fused):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import numpy as np
+from tqdm import tqdm
+
+import development.commons.dataset_io as dataset_io
+import development.commons.env as env
+from development.commons.embedding_backend import EMBEDDING_BACKENDS, load_embedding_backend
+from development.commons.utils import get_opensearch_client
+
+
+def load_questions(number_of_questions: int) -> list[dict]:
+    with open(env.RETRIEVAL_TESTSET_PATH, "r") as input:
+        return json.load(input)["questions"][:number_of_questions]
+
+
+def load_fragments(number_of_fragments: int) -> list[str]:
+    documents = dataset_io.iter_documents(env.ABSTRACT_FRAGMENT_DATASET_PATH, columns=["abstract_fragment"])
+    return [document["abstract_fragment"] for document in islice(documents, number_of_fragments)]
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """
+    The cosine similarity between the reference and the candidate embedding of every text.
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def query_latencies_ms(backend, queries: list[str]) -> np.ndarray:
+    # Encode one query at a time, as the retrievers do
+    backend.encode(queries[0])
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.encode(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def recall_at_k(client, query_embeddings: np.ndarray, questions: list[dict], k: int) -> float:
+    """
+    The share of questions whose source fragment is among the k nearest neighbours in the fragment index.
+    """
+    hits = 0
+    for embedding, question in tqdm(zip(query_embeddings, questions), total=len(questions), file=sys.stdout):
+        query = {"knn": {"abstract_fragment_embedding": {"vector": embedding, "k": k}}}
+        response = client.search(
+            body={"size": k, "query": query},
+            index=env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX,
+            _source_includes=["_id"],
+        )
+        hits += int(question["id"] in [hit["_id"] for hit in response["hits"]["hits"]])
+    return hits / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend with the fp32 SentenceTransformer.")
+    parser.add_argument("--backend", default="onnx_int8", choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--fragments", type=int, default=1000, help="Number of fragments for the cosine agreement.")
+    parser.add_argument("--questions", type=int, default=500, help="Number of testset questions.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--skip-recall", action="store_true", help="Do not query OpenSearch.")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    queries = [question["question"] for question in questions]
+    fragments = load_fragments(args.fragments)
+
+    reference_backend = load_embedding_backend("sentence_transformer")
+    candidate_backend = load_embedding_backend(args.backend)
+
+    # Cosine agreement on documents and queries
+    for name, texts in [("fragments", fragments), ("queries", queries)]:
+        agreement = cosine_agreement(reference_backend.encode(texts), candidate_backend.encode(texts))
+        print(f"Cosine agreement on {len(texts)} {name}: mean {agreement.mean():.5f}, "
+              f"p1 {np.percentile(agreement, 1):.5f}, min {agreement.min():.5f}")
+
+    # Query encoding latency
+    print(f"{'backend':<22}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    reference_latencies = query_latencies_ms(reference_backend, queries)
+    candidate_latencies = query_latencies_ms(candidate_backend, queries)
+    for name, latencies in [("sentence_transformer", reference_latencies), (args.backend, candidate_latencies)]:
+        print(f"{name:<22}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}")
+    print(f"Speedup (p50): {np.percentile(reference_latencies, 50) / np.percentile(candidate_latencies, 50):.2f}x")
+
+    # Recall on the retrieval testset against the (fp32) fragment index
+    if not args.skip_recall:
+        client = get_opensearch_client()
+        reference_recall = recall_at_k(client, reference_backend.encode(queries), questions, args.k)
+        candidate_recall = recall_at_k(client, candidate_backend.encode(queries), questions, args.k)
+        print(f"Recall@{args.k}: sentence_transformer {reference_recall:.4f}, {args.backend} {candidate_recall:.4f}, "
+              f"delta {candidate_recall - reference_recall:+.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from development.retrieve.opensearch_connector import (
     create_hybrid_query,
     extract_hits_from_response,
 )
+from development.retrieve.query_context import QueryContext
 import ijson
 from pydantic import BaseModel, FilePath
 from typing import Callable, Literal
@@ -120,6 +121,7 @@ def evaluate_pipeline(
     strategy: Literal[
         "reciprocal_rank_fusion", "opensearch_hybrid"
     ] = "opensearch_hybrid",
+    query_contexts: dict[str, QueryContext] = None,
 ) -> list[dict[str, float]]:
     """
     Evaluate a set of queries against a search pipeline using multiple evaluation metrics.
@@ -140,6 +142,7 @@ def evaluate_pipeline(
         Each dictionary in this list corresponds to the respective metric in `eval_metrics`.
         If None, an empty dictionary is used for each metric.
     :param strategy: The strategy to use for retrieval. Options are "opensearch_hybrid" and "reciprocal_rank_fusion".
+    :param query_contexts: The query contexts by query id, so every question is encoded once for all weights.
     :return: A list of dictionaries, each representing the scores of a single query across all metrics.
         The keys in each dictionary are the names of the evaluation metrics, and the values are the scores.
 
@@ -157,8 +160,9 @@ def evaluate_pipeline(
     scores = []
     for query in queries:
         retrieved_document_ids = []
+        context = (query_contexts or {}).get(query.id) or QueryContext(query.question)
         if strategy == "opensearch_hybrid":
-            hybrid_query = create_hybrid_query(query.question)
+            hybrid_query = create_hybrid_query(query.question, context=context)
             response = execute_hybrid_query(
                 hybrid_query, pipeline_weight, index, source_includes, size
             )
@@ -166,7 +170,7 @@ def evaluate_pipeline(
             retrieved_document_ids = [hit["_id"] for hit in hits]
         elif strategy == "reciprocal_rank_fusion":
             fragments = _retrieve_abstract_fragments_reciprocal_rank_fusion(
-                query.question, None, size, pipeline_weight
+                query.question, None, size, pipeline_weight, context
             )
             retrieved_document_ids = [fragment.id for fragment in fragments]
         else:
@@ -221,6 +225,7 @@ def main():
         total=total_queries_to_process,
     ):
         queries = [Query(**question) for question in questions_batch]
+        query_contexts = {query.id: QueryContext(query.question) for query in queries}
         for pipeline_weight in pipeline_weights:
             # if an error occours the program will wait 5 seconds and try again
             # -> this helps to avoid connection errors
@@ -237,6 +242,7 @@ def main():
                         eval_metrics,
                         eval_metric_settings,
                         "opensearch_hybrid",
+                        query_contexts,
                     )
                     results_rrf = evaluate_pipeline(
                         pipeline_weight,
@@ -247,6 +253,7 @@ def main():
                         eval_metrics,
                         eval_metric_settings,
                         "reciprocal_rank_fusion",
+                        query_contexts,
                     )
                     break
                 except Exception as e:
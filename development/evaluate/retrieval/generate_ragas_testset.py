@@ -1,10 +1,12 @@
 import sys
 from pathlib import Path
 import random
+from itertools import islice
 
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from development.commons import env
+from development.commons import dataset_io
 from development.retrieve.opensearch_connector import (
     execute_query,
     create_single_match_BM25_query,
@@ -25,7 +27,6 @@ from pydantic.json import pydantic_encoder
 _ = load_dotenv(find_dotenv(raise_error_if_not_found=True))
 
 
-from langchain_community.document_loaders import JSONLoader
 from langchain_core.documents import Document
 from ragas import evaluate
 from ragas.testset.generator import TestsetGenerator
@@ -41,14 +42,22 @@ def extract_metadata_abstracts(record: dict, metadata: dict):
     return metadata
 
 
+def load_langchain_documents(path: str, content_key: str, metadata_func, amount: int = None) -> list[Document]:
+    # Stream the records instead of loading the whole dataset, so that only `amount` records are read
+    records = islice(dataset_io.iter_documents(path), amount)
+    return [
+        Document(page_content=record[content_key], metadata=metadata_func(record, {}))
+        for record in records
+    ]
+
+
 def get_abstract_documents(amount: int = 10) -> list[Document]:
-    data = JSONLoader(
-        file_path=env.ABSTRACTS_DATASET_PATH,
-        jq_schema=".documents[]",
+    return load_langchain_documents(
+        path=env.ABSTRACTS_DATASET_PATH,
         content_key="abstract",
         metadata_func=extract_metadata_abstracts,
-    ).load()
-    return data[:amount]
+        amount=amount,
+    )
 
 
 def extract_metadata_abstract_fragments(record: dict, metadata: dict):
@@ -63,14 +72,13 @@ def extract_metadata_abstract_fragments(record: dict, metadata: dict):
 
 
 def get_abstract_fragments(amount: int = 10) -> list[Document]:
-    data = JSONLoader(
-        file_path=env.ABSTRACT_FRAGMENT_DATASET_PATH,
-        jq_schema=".documents[]",
+    data = load_langchain_documents(
+        path=env.ABSTRACT_FRAGMENT_DATASET_PATH,
         content_key="abstract_fragment",
         metadata_func=extract_metadata_abstract_fragments,
-    ).load()
+    )
     if amount is None:
-        return datagenerate_with_langchain_docs
+        return data
 
     # shuffle the data and return the first 'amount' of documents
     random.shuffle(data)
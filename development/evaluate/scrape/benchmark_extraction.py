@@ -0,0 +1,93 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from development.scrape.pubmed_extractor import EXTRACTION_BACKENDS
+from development.scrape.raw_shard_store import RawShardStore
+
+
+def record_digest(document):
+    return hashlib.sha1(json.dumps(document, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def run_backend(backend: str, shard_paths: list[str], results):
+    """
+    Extract the given shards with one backend. This runs in a fresh process, so that the
+    peak resident set size is not influenced by the other backend.
+    """
+    extract = EXTRACTION_BACKENDS[backend]
+    digests = []
+    without_abstract = 0
+    without_author = 0
+
+    start = time.perf_counter()
+    for path in shard_paths:
+        documents, shard_without_abstract, shard_without_author = extract(path)
+        digests.extend(record_digest(document) for document in documents)
+        without_abstract += shard_without_abstract
+        without_author += shard_without_author
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+
+    results.put({
+        "backend": backend,
+        "records": len(digests),
+        "seconds": elapsed,
+        "records_per_second": len(digests) / elapsed if elapsed > 0 else float("inf"),
+        "peak_rss_mb": peak_rss_mb,
+        "without_abstract": without_abstract,
+        "without_author": without_author,
+        "digests": digests,
+    })
+
+
+def benchmark(backends: list[str], shard_paths: list[str]) -> list[dict]:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in backends:
+        queue = context.Queue()
+        process = context.Process(target=run_backend, args=(backend, shard_paths, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the extraction backends on the same raw shards.")
+    parser.add_argument("--shards", type=int, default=None, help="Only use the first N shards.")
+    parser.add_argument("--backends", nargs="+", default=list(EXTRACTION_BACKENDS))
+    args = parser.parse_args()
+
+    shard_paths = RawShardStore().shard_paths()[:args.shards]
+    print(f"Benchmarking {args.backends} on {len(shard_paths)} shards...")
+    results = benchmark(args.backends, shard_paths)
+
+    print(f"{'backend':<10}{'records':>10}{'seconds':>10}{'records/s':>12}{'peak RSS (MB)':>16}")
+    for result in results:
+        print(f"{result['backend']:<10}{result['records']:>10}{result['seconds']:>10.2f}"
+              f"{result['records_per_second']:>12.0f}{result['peak_rss_mb']:>16.1f}")
+
+    # Both backends must emit identical records and statistics
+    reference = results[0]
+    for result in results[1:]:
+        mismatches = sum(a != b for a, b in zip(reference["digests"], result["digests"]))
+        mismatches += abs(len(reference["digests"]) - len(result["digests"]))
+        same_statistics = (reference["without_abstract"] == result["without_abstract"]
+                           and reference["without_author"] == result["without_author"])
+        print(f"Parity {reference['backend']} vs. {result['backend']}: {mismatches} differing records, "
+              f"statistics {'match' if same_statistics else 'differ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from development.scrape.pubmed_extractor import EXTRACTION_BACKENDS, extract_shards
+from development.scrape.raw_shard_store import RawShardStore
+
+
+def benchmark_workers(shard_paths: list[str], backend: str, workers: int) -> dict:
+    """
+    Extract all shards with the given number of workers and measure the throughput.
+    """
+    extract = EXTRACTION_BACKENDS[backend]
+    records = 0
+    # A hash of the complete pmid sequence, so any reordering (also within a shard) is detected
+    pmid_hash = hashlib.sha256()
+
+    start = time.perf_counter()
+    for documents, _, _ in extract_shards(shard_paths, extract, workers):
+        records += len(documents)
+        for document in documents:
+            pmid_hash.update(f"{document['pmid']}\n".encode())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "workers": workers,
+        "records": records,
+        "seconds": elapsed,
+        "records_per_second": records / elapsed if elapsed > 0 else float("inf"),
+        "pmid_hash": pmid_hash.hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how shard extraction scales with the number of workers.")
+    parser.add_argument("--backend", default="entrez", choices=list(EXTRACTION_BACKENDS))
+    parser.add_argument("--shards", type=int, default=None, help="Only use the first N shards.")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    shard_paths = RawShardStore().shard_paths()[:args.shards]
+    print(f"Benchmarking the {args.backend} backend on {len(shard_paths)} shards ({os.cpu_count()} cores)...")
+
+    results = [benchmark_workers(shard_paths, args.backend, workers) for workers in args.workers]
+    baseline = results[0]
+
+    print(f"{'workers':>8}{'records':>10}{'seconds':>10}{'records/s':>12}{'speedup':>10}{'order':>8}")
+    for result in results:
+        # The record order must not depend on the number of workers
+        same_order = result["pmid_hash"] == baseline["pmid_hash"]
+        print(f"{result['workers']:>8}{result['records']:>10}{result['seconds']:>10.2f}"
+              f"{result['records_per_second']:>12.0f}{baseline['seconds'] / result['seconds']:>10.2f}"
+              f"{'ok' if same_order else 'differs':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Local stand-in for the NCBI E-utilities (esearch/efetch) that serves a synthetic PubMed corpus.
+It is used to exercise the scraper without touching the real API, including its rate limit and failure handling.
+
+Usage:
+    python development/evaluate/scrape/entrez_stand_in_server.py --port 8765 --failure-rate 0.1
+and set `ENTREZ_BASE_URL = "http://localhost:8765/"` in `development/commons/env.py`.
+"""
+import argparse
+import bisect
+import datetime
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+# ===== Constants =====
+CORPUS_START_DATE = datetime.date(2013, 1, 1)
+CORPUS_END_DATE = datetime.date(2023, 12, 31)
+ARTICLE_SET_HEADER = ('<?xml version="1.0" ?>\n'
+                      '<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2019//EN" '
+                      '"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_190101.dtd">\n')
+SEARCH_RESULT_HEADER = ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+                        '<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" '
+                        '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">\n')
+# ===== Constants =====
+
+
+class StandInCorpus:
+    """
+    Synthetic corpus with pmids 1..size whose publication dates are spread evenly over the corpus time span.
+    Every 7th article has no abstract and every 5th article has no authors.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.histories = {}
+        self.lock = threading.Lock()
+
+    def publication_date(self, pmid: int) -> datetime.date:
+        span = (CORPUS_END_DATE - CORPUS_START_DATE).days
+        return CORPUS_START_DATE + datetime.timedelta(days=(pmid - 1) * span // max(1, self.size - 1))
+
+    def search(self, mindate: str = None, maxdate: str = None) -> list[int]:
+        start = _parse_date(mindate, first=True) if mindate else CORPUS_START_DATE
+        end = _parse_date(maxdate, first=False) if maxdate else CORPUS_END_DATE
+        # Publication dates grow with the pmid, so the hits are a contiguous range of pmids
+        pmids = range(1, self.size + 1)
+        first = bisect.bisect_left(pmids, start, key=self.publication_date)
+        last = bisect.bisect_right(pmids, end, key=self.publication_date)
+        return list(pmids[first:last])
+
+    def store_history(self, pmids: list[int]) -> str:
+        with self.lock:
+            webenv = f"STANDIN_{len(self.histories) + 1}"
+            self.histories[webenv] = pmids
+        return webenv
+
+    def article_xml(self, pmid: int) -> str:
+        date = self.publication_date(pmid)
+        abstract = "" if pmid % 7 == 0 else (
+            "<Abstract>"
+            f"<AbstractText Label=\"BACKGROUND\">Background of article {pmid} on artificial <i>intelligence</i>.</AbstractText>"
+            f"<AbstractText Label=\"RESULTS\">Results of article {pmid}.</AbstractText>"
+            "</Abstract>"
+        )
+        authors = "" if pmid % 5 == 0 else (
+            "<AuthorList CompleteYN=\"Y\">"
+            f"<Author ValidYN=\"Y\"><LastName>Doe</LastName><ForeName>Jane {pmid}</ForeName></Author>"
+            "<Author ValidYN=\"Y\"><CollectiveName>Stand-In Consortium</CollectiveName></Author>"
+            "</AuthorList>"
+        )
+        return (
+            "<PubmedArticle>"
+            "<MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\">"
+            f"<PMID Version=\"1\">{pmid}</PMID>"
+            "<Article PubModel=\"Print\">"
+            f"<ArticleTitle>{escape(f'Article {pmid} about intelligence')}</ArticleTitle>"
+            f"<ELocationID EIdType=\"doi\" ValidYN=\"Y\">10.0000/standin.{pmid}</ELocationID>"
+            f"{abstract}"
+            f"{authors}"
+            "</Article>"
+            "<KeywordList Owner=\"NOTNLM\"><Keyword MajorTopicYN=\"N\">intelligence</Keyword></KeywordList>"
+            "</MedlineCitation>"
+            "<PubmedData><History>"
+            f"<PubMedPubDate PubStatus=\"pubmed\"><Year>{date.year}</Year><Month>{date.month}</Month>"
+            f"<Day>{date.day}</Day></PubMedPubDate>"
+            "</History></PubmedData>"
+            "</PubmedArticle>"
+        )
+
+
+def _parse_date(value: str, first: bool) -> datetime.date:
+    # E-utilities accept YYYY, YYYY/MM and YYYY/MM/DD
+    parts = [int(part) for part in value.split("/")]
+    year = parts[0]
+    month = parts[1] if len(parts) > 1 else (1 if first else 12)
+    if len(parts) > 2:
+        return datetime.date(year, month, parts[2])
+    if first:
+        return datetime.date(year, month, 1)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return next_month - datetime.timedelta(days=1)
+
+
+def create_handler(corpus: StandInCorpus, failure_rate: float, max_requests_per_second: float):
+    request_times = []
+    request_lock = threading.Lock()
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._handle(parse_qs(urlparse(self.path).query))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self._handle(parse_qs(self.rfile.read(length).decode()))
+
+        def _handle(self, query):
+            params = {key: values[0] for key, values in query.items()}
+
+            # Reject requests that exceed the configured rate limit just like NCBI does
+            with request_lock:
+                now = time.monotonic()
+                request_times[:] = [t for t in request_times if now - t < 1.0]
+                request_times.append(now)
+                over_limit = max_requests_per_second and len(request_times) > max_requests_per_second
+            if over_limit:
+                return self._respond(429, "API rate limit exceeded")
+            if random.random() < failure_rate:
+                return self._respond(random.choice([429, 500, 502]), "Injected failure")
+
+            utility = urlparse(self.path).path.rstrip("/").split("/")[-1]
+            if utility == "esearch.fcgi":
+                return self._respond(200, self._esearch(params))
+            if utility == "efetch.fcgi":
+                return self._respond(200, self._efetch(params))
+            return self._respond(404, "Unknown utility")
+
+        def _esearch(self, params):
+            pmids = corpus.search(params.get("mindate"), params.get("maxdate"))
+            retstart = int(params.get("retstart", 0))
+            retmax = int(params.get("retmax", 20))
+            history = ""
+            if params.get("usehistory") == "y":
+                history = f"<QueryKey>1</QueryKey><WebEnv>{corpus.store_history(pmids)}</WebEnv>"
+            ids = "".join(f"<Id>{pmid}</Id>" for pmid in pmids[retstart:retstart + retmax])
+            return (f"{SEARCH_RESULT_HEADER}<eSearchResult><Count>{len(pmids)}</Count><RetMax>{retmax}</RetMax>"
+                    f"<RetStart>{retstart}</RetStart>{history}<IdList>{ids}</IdList>"
+                    "<TranslationSet/><QueryTranslation/></eSearchResult>")
+
+        def _efetch(self, params):
+            if "WebEnv" in params:
+                retstart = int(params.get("retstart", 0))
+                retmax = int(params.get("retmax", 20))
+                pmids = corpus.histories[params["WebEnv"]][retstart:retstart + retmax]
+            else:
+                pmids = [int(pmid) for pmid in params.get("id", "").split(",") if pmid]
+            articles = "".join(corpus.article_xml(pmid) for pmid in pmids)
+            return f"{ARTICLE_SET_HEADER}<PubmedArticleSet>{articles}</PubmedArticleSet>"
+
+        def _respond(self, status, body):
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/xml" if status == 200 else "text/plain")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return StandInHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the NCBI E-utilities.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--corpus-size", type=int, default=25000)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail randomly.")
+    parser.add_argument("--max-requests-per-second", type=float, default=3,
+                        help="Requests above this rate are answered with HTTP 429 (0 disables the limit).")
+    args = parser.parse_args()
+
+    handler = create_handler(StandInCorpus(args.corpus_size), args.failure_rate, args.max_requests_per_second)
+    server = ThreadingHTTPServer(("localhost", args.port), handler)
+    print(f"[{datetime.datetime.now()}] Serving stand-in E-utilities on http://localhost:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,28 @@
-import json
 import sys
+import argparse
+import contextlib
 import datetime
+import numpy as np
 import torch
 
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from sentence_transformers import SentenceTransformer
-from opensearchpy import helpers
-from opensearchpy.exceptions import NotFoundError
 from tqdm import tqdm
 
+import development.commons.dataset_io as dataset_io
+from development.commons.embedding_backend import (
+    SentenceTransformerBackend, load_embedding_backend, normalize_embeddings
+)
 import development.commons.env as env
 import development.commons.utils as utils
+import development.ingest.index_versioning as index_versioning
+import development.ingest.vector_index_profiles as vector_index_profiles
+from development.ingest.bulk_loader import BulkLoader, bulk_load_mode, serialize_bulk_data
+from development.ingest.incremental_ingestion import add_content_hashes, update_index
+from development.ingest.embedding_cache import EmbeddingCache
+from development.ingest.embedding_engine import CpuEmbeddingEngine
+from development.ingest.ingest_pipeline import PipelineStage, StreamingPipeline
 
 # ===== Constants =====
 INDEX_CONTENT_NAME = "abstract_fragment"
@@ -45,19 +55,16 @@ def insert_ingest_pipeline():
 
 
 def insert_index(ingest_pipeline_id):
-    try:
-        # Try to delete an already existing index as this facilitates "re-indexing"
-        print(f"[{datetime.datetime.now()}] Trying to delete existing index...")
-        delete_result = OPENSEARCH_CLIENT.indices.delete(env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX)
-        print(f"[{datetime.datetime.now()}] Deletion result: {delete_result}")
-    except NotFoundError:
-        pass
-
+    """
+    Create a new version of the index next to the live one, which keeps serving searches during the ingestion.
+    :return: The name of the new index.
+    """
     settings = {
         "settings": {
             "number_of_shards": 1,
             "number_of_replicas": 1,
             "index.knn": True,
+            **vector_index_profiles.knn_index_settings(),
             "default_pipeline": ingest_pipeline_id,
             "analysis": {
                 "analyzer": {
@@ -85,82 +92,159 @@ def insert_index(ingest_pipeline_id):
                 "fragment_id": {"type": "integer"},
                 "number_of_fragments": {"type": "integer"},
                 "id": {"type": "keyword"},
+                "content_hash": {"type": "keyword"},
                 INDEX_CONTENT_NAME: {
                     "type": "text",
                     "analyzer": "content_analyzer"
                 },
-                INDEX_CONTENT_EMBEDDING_NAME: {
-                    "type": "knn_vector",
-                    "dimension": env.EMBEDDING_DIMENSION,
-                    "method": {
-                        "space_type": "cosinesimil",
-                        "name": "hnsw",
-                    }
-                },
+                INDEX_CONTENT_EMBEDDING_NAME: vector_index_profiles.knn_field_mapping(OPENSEARCH_CLIENT),
             }
         }
     }
 
-    print(f"[{datetime.datetime.now()}] Configuring index {env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX}...")
-    configure_result = OPENSEARCH_CLIENT.indices.create(index=env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX, body=settings)
-    print(f"[{datetime.datetime.now()}] Configuration result: {configure_result}")
-
+    return index_versioning.create_versioned_index(OPENSEARCH_CLIENT, env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX, settings)
 
-def embed_abstract_fragments(documents):
-    abstract_fragments = [doc[INDEX_CONTENT_NAME] for doc in documents]
 
-    model = SentenceTransformer(env.EMBEDDING_MODEL_NAME)
+def load_embedding_model():
+    """
+    Load the configured embedding backend. The PyTorch model runs on an accelerator if one is available,
+    otherwise in the multi-process CPU engine.
+    """
+    # Embeddings are cached as computed by the model and normalized afterwards (see `embed_abstract_fragments`)
+    if env.EMBEDDING_BACKEND != "sentence_transformer":
+        return load_embedding_backend(normalize=False)
     if torch.backends.mps.is_available():
-        device = torch.device("mps")
-        model.to(device)
+        return SentenceTransformerBackend().to(torch.device("mps"))
+    if torch.cuda.is_available() or env.EMBEDDING_WORKERS <= 1:
+        return SentenceTransformerBackend()
+    return CpuEmbeddingEngine()
 
-    embeddings = []
-    batch_size = 100
-    print(f"[{datetime.datetime.now()}] Embedding {len(abstract_fragments)} abstract fragments in batches of size {batch_size} on device {model.device}...")
-    for i in tqdm(range(0, len(abstract_fragments), batch_size)):
-        embeddings.extend(model.encode(abstract_fragments[i:i+batch_size]))
 
-    for doc, embedding in zip(documents, embeddings):
-        doc[INDEX_CONTENT_EMBEDDING_NAME] = embedding
-    print (f"[{datetime.datetime.now()}] Done embedding fragments.")
-
-
-def _bulk_data(documents, index_name):
-    for doc in tqdm(documents, file=sys.stdout, total=len(documents)):
-        _id: str = doc['id']
-
-        yield {
-            "_op_type": "create",
-            "_index": index_name,
-            "_id": _id,
-            "_source": doc,
-        }
+def embed_abstract_fragments(documents, model, cache=None):
+    """
+    Embed the fragments of the given documents. If a cache is given, only fragments whose embedding
+    is not cached yet are encoded.
+    """
+    abstract_fragments = [doc[INDEX_CONTENT_NAME] for doc in documents]
 
+    if cache is not None:
+        embeddings, missing = cache.lookup(abstract_fragments)
+    else:
+        embeddings, missing = [None] * len(abstract_fragments), list(range(len(abstract_fragments)))
 
-def fill_index():
-    # Load Data
-    with open(env.ABSTRACT_FRAGMENT_DATASET_PATH, 'r') as f:
-        documents = json.load(f)['documents']
+    missing_fragments = [abstract_fragments[i] for i in missing]
+    # The CPU engine batches by its token budget, a fixed batch size would only split its work into smaller tasks
+    encode_options = {} if isinstance(model, CpuEmbeddingEngine) else {"batch_size": 100}
+    computed = list(model.encode(missing_fragments, **encode_options)) if len(missing_fragments) > 0 else []
+    for i, embedding in zip(missing, computed):
+        embeddings[i] = embedding
+    if cache is not None:
+        cache.add(missing_fragments, computed)
 
-    embed_abstract_fragments(documents)
+    if env.NORMALIZE_EMBEDDINGS:
+        embeddings = normalize_embeddings(np.asarray(embeddings))
 
-    # Ingest data using the bulk api
-    print(f"[{datetime.datetime.now()}] Inserting data into index {env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX}...")
-    generator = _bulk_data(documents, env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX)
-    nb_inserted, errors = helpers.bulk(OPENSEARCH_CLIENT, generator, chunk_size=64, max_retries=2, timeout=60)
+    for doc, embedding in zip(documents, embeddings):
+        doc[INDEX_CONTENT_EMBEDDING_NAME] = embedding
+    return documents
+
+
+def embedding_batch_size(model, batch_size=env.INGEST_BATCH_SIZE):
+    """
+    The number of fragments per pipeline batch. The CPU engine needs larger batches to keep all its workers busy.
+    """
+    if isinstance(model, CpuEmbeddingEngine):
+        return max(batch_size, model.input_batch_size())
+    return batch_size
+
+
+def fill_index(index_name, batch_size=env.INGEST_BATCH_SIZE, queue_depth=env.INGEST_QUEUE_DEPTH, use_cache=True):
+    """
+    Stream the fragments through the stages read -> embed -> serialize -> bulk.
+    Every stage runs concurrently, so indexing overlaps with embedding, and at most `queue_depth`
+    batches of `batch_size` fragments are held in memory between two stages.
+    """
+    number_of_documents = dataset_io.count_documents(env.ABSTRACT_FRAGMENT_DATASET_PATH)
+    model = load_embedding_model()
+    batch_size = embedding_batch_size(model, batch_size)
+    cache = EmbeddingCache(model_name=model.name) if use_cache else None
+    progress = tqdm(total=number_of_documents, file=sys.stdout)
+    loader = BulkLoader(OPENSEARCH_CLIENT, progress=progress.update)
+
+    pipeline = StreamingPipeline(
+        source=dataset_io.iter_document_batches(env.ABSTRACT_FRAGMENT_DATASET_PATH, batch_size=batch_size),
+        stages=[
+            PipelineStage("embed", lambda documents: embed_abstract_fragments(documents, model, cache)),
+            PipelineStage("serialize", lambda documents: serialize_bulk_data(
+                OPENSEARCH_CLIENT, add_content_hashes(documents), index_name, id_field="id")),
+            PipelineStage("bulk", loader.add),
+        ],
+        queue_depth=queue_depth,
+    )
 
-    if nb_inserted != len(documents):
-        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{len(documents)} fragments.")
-        print(f"[{datetime.datetime.now()}] See console output above and below for error details.")
+    print(f"[{datetime.datetime.now()}] Embedding and inserting {number_of_documents} fragments into index "
+          f"{index_name} on device {model.device} in batches of {batch_size}...")
+    try:
+        with bulk_load_mode(OPENSEARCH_CLIENT, index_name) if env.BULK_LOAD_MODE else contextlib.nullcontext():
+            with loader:
+                pipeline.run()
+    finally:
+        progress.close()
+        if isinstance(model, CpuEmbeddingEngine):
+            model.close()
+    pipeline.report()
+    loader.report()
+    if cache is not None:
+        print(f"[{datetime.datetime.now()}] Embedding cache: {cache.hits} hits, {cache.misses} misses "
+              f"({len(cache)} cached embeddings).")
+
+    nb_inserted, errors = loader.inserted, loader.errors
+    if nb_inserted != number_of_documents:
+        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{number_of_documents} fragments.")
+        print(f"[{datetime.datetime.now()}] Errors: {errors}")
     else:
-        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{len(documents)} fragments.")
+        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{number_of_documents} fragments.")
         print(f"[{datetime.datetime.now()}] {f'Errors: {errors}' if len(errors) > 0 else 'No errors.'}")
+    return number_of_documents
+
+
+def update_fill_index():
+    """
+    Incrementally update the live index: only new or changed abstracts are embedded and (re-)indexed,
+    fragments of removed abstracts are deleted.
+    """
+    model = load_embedding_model()
+    cache = EmbeddingCache(model_name=model.name)
+    try:
+        update_index(
+            OPENSEARCH_CLIENT,
+            env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX,
+            dataset_io.iter_document_batches(env.ABSTRACT_FRAGMENT_DATASET_PATH, batch_size=env.INGEST_BATCH_SIZE),
+            id_field="id",
+            prepare=lambda documents: embed_abstract_fragments(documents, model, cache),
+            batch_size=embedding_batch_size(model),
+        )
+    finally:
+        if isinstance(model, CpuEmbeddingEngine):
+            model.close()
 
 
 if __name__ == "__main__":
-    # Configure Ingest Pipeline and Index
+    parser = argparse.ArgumentParser(description="Ingest the abstract fragments into OpenSearch.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only index new or changed fragments into the live index instead of rebuilding it.")
+    args = parser.parse_args()
+
+    # Configure Ingest Pipeline
     ingest_pipeline_id = insert_ingest_pipeline()
-    insert_index(ingest_pipeline_id)
 
-    # Fill Index
-    fill_index()
+    if args.incremental:
+        update_fill_index()
+    else:
+        # Configure and fill a new version of the Index
+        index_name = insert_index(ingest_pipeline_id)
+        number_of_documents = fill_index(index_name)
+
+        # Switch the alias to the new index
+        index_versioning.publish_index(OPENSEARCH_CLIENT, env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX, index_name,
+                                       number_of_documents)
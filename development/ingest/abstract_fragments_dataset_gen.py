@@ -1,28 +1,47 @@
 import datetime
-import json
-import os
 import sys
 
-from langchain.text_splitter import SentenceTransformersTokenTextSplitter
 from tqdm import tqdm
 
+import development.commons.dataset_io as dataset_io
 import development.commons.env as env
+from development.ingest.fragment_splitter import FragmentSplitter
 
 
 def load_document_splitter():
-    print(f"[{datetime.datetime.now()}] Loading Document Splitter ({env.EMBEDDING_MODEL_NAME})")
-    return SentenceTransformersTokenTextSplitter(
+    print(f"[{datetime.datetime.now()}] Loading Document Splitter ({env.EMBEDDING_MODEL_NAME}, {env.SPLIT_WORKERS} workers, "
+          f"tail pruning {'on' if env.PRUNE_TAIL_FRAGMENTS else 'off'})")
+    return FragmentSplitter(
         model_name=env.EMBEDDING_MODEL_NAME,
-        chunk_overlap=env.FRAGMENT_OVERLAP,
-        tokens_per_chunk=env.TOKENS_PER_FRAGMENT
+        tokens_per_fragment=env.TOKENS_PER_FRAGMENT,
+        overlap=env.FRAGMENT_OVERLAP,
+        workers=env.SPLIT_WORKERS,
+        prune_tail_fragments=env.PRUNE_TAIL_FRAGMENTS,
+        min_tail_tokens=env.MIN_TAIL_FRAGMENT_TOKENS,
+        max_merged_tokens=env.MAX_MERGED_FRAGMENT_TOKENS,
     )
 
 
 def load_dataset():
     print(f"[{datetime.datetime.now()}] Loading Documents")
-    with open(env.CLEANED_DATASET_PATH, 'r') as input:
-        dataset = json.load(input)
-    return dataset
+    return {
+        **dataset_io.load_metadata(env.INGEST_DATASET_PATH),
+        'documents': dataset_io.load_documents(env.INGEST_DATASET_PATH),
+    }
+
+
+def create_fragment_documents(document, abstract_fragments):
+    fragments = []
+    for index, fragment in enumerate(abstract_fragments):
+        document_fragment = document.copy()
+
+        del document_fragment['abstract']
+        document_fragment['fragment_id'] = index
+        document_fragment['number_of_fragments'] = len(abstract_fragments)
+        document_fragment['abstract_fragment'] = fragment
+        document_fragment['id'] = f"{document['pmid']}_{index}"
+        fragments.append(document_fragment)
+    return fragments
 
 
 def split_documents(dataset, splitter):
@@ -30,17 +49,11 @@ def split_documents(dataset, splitter):
     documents = dataset["documents"]
     fragments = []
 
-    for document in tqdm(documents, total=len(documents), file=sys.stdout):
-        abstract_fragments = splitter.split_text(text=document['abstract'])
-        for index, fragment in enumerate(abstract_fragments):
-            document_fragment = document.copy()
+    # All abstracts are tokenized and split in one batched pass
+    split_abstracts = splitter.split_texts([document['abstract'] for document in documents])
 
-            del document_fragment['abstract']
-            document_fragment['fragment_id'] = index
-            document_fragment['number_of_fragments'] = len(abstract_fragments)
-            document_fragment['abstract_fragment'] = fragment
-            document_fragment['id'] = f"{document['pmid']}_{index}"
-            fragments.append(document_fragment)
+    for document, abstract_fragments in tqdm(zip(documents, split_abstracts), total=len(documents), file=sys.stdout):
+        fragments.extend(create_fragment_documents(document, abstract_fragments))
 
     print(f"[{datetime.datetime.now()}] Collected {len(fragments)} fragments from {len(documents)} documents")
     dataset = {
@@ -53,13 +66,8 @@ def split_documents(dataset, splitter):
 
 
 def save_fragments(fragments):
-    folder_path = os.path.dirname(env.ABSTRACT_FRAGMENT_DATASET_PATH)
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    print(f"[{datetime.datetime.now()}] Saving Fragments ({env.ABSTRACT_FRAGMENT_DATASET_PATH})")
-    with open(env.ABSTRACT_FRAGMENT_DATASET_PATH, 'w') as output:
-        json.dump(fragments, output, indent=2, default=str)
+    print(f"[{datetime.datetime.now()}] Saving Fragments ({dataset_io.dataset_path(env.ABSTRACT_FRAGMENT_DATASET_PATH)})")
+    dataset_io.save_dataset(fragments, env.ABSTRACT_FRAGMENT_DATASET_PATH)
     print(f"[{datetime.datetime.now()}] Fragments successfully saved!")
 
 
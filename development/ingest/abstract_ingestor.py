@@ -1,16 +1,19 @@
-import json
 import sys
+import argparse
+import contextlib
 import datetime
 
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from opensearchpy import helpers
-from opensearchpy.exceptions import NotFoundError
 from tqdm import tqdm
 
+import development.commons.dataset_io as dataset_io
 import development.commons.env as env
 import development.commons.utils as utils
+import development.ingest.index_versioning as index_versioning
+from development.ingest.bulk_loader import BulkLoader, bulk_load_mode, serialize_bulk_data
+from development.ingest.incremental_ingestion import add_content_hashes, update_index
 
 # ===== Constants =====
 OPENSEARCH_CLIENT = utils.get_opensearch_client()
@@ -41,14 +44,10 @@ def insert_ingest_pipeline():
 
 
 def insert_index(ingest_pipeline_id):
-    try:
-        # Try to delete an already existing index as this facilitates "re-indexing"
-        print(f"[{datetime.datetime.now()}] Trying to delete existing index...")
-        delete_result = OPENSEARCH_CLIENT.indices.delete(env.OPENSEARCH_ABSTRACT_INDEX)
-        print(f"[{datetime.datetime.now()}] Deletion result: {delete_result}")
-    except NotFoundError:
-        pass
-
+    """
+    Create a new version of the index next to the live one, which keeps serving searches during the ingestion.
+    :return: The name of the new index.
+    """
     settings = {
         "settings": {
             "number_of_shards": 1,
@@ -78,50 +77,67 @@ def insert_index(ingest_pipeline_id):
                     "type": "date",
                     "format": "yyyy-MM-dd||yyyy" # yyyy is required for self-query
                 },
-                "ingested_at": {"type": "date"}
+                "ingested_at": {"type": "date"},
+                "content_hash": {"type": "keyword"}
             }
         }
     }
 
-    print(f"[{datetime.datetime.now()}] Configuring index {env.OPENSEARCH_ABSTRACT_INDEX}...")
-    configure_result = OPENSEARCH_CLIENT.indices.create(index=env.OPENSEARCH_ABSTRACT_INDEX, body=settings)
-    print(f"[{datetime.datetime.now()}] Configuration result: {configure_result}")
-
-
-def _bulk_data(documents, index_name):
-    for doc in tqdm(documents, file=sys.stdout, total=len(documents)):
-        _id: str = doc['pmid']
-
-        yield {
-            "_op_type": "create",
-            "_index": index_name,
-            "_id": _id,
-            "_source": doc,
-        }
+    return index_versioning.create_versioned_index(OPENSEARCH_CLIENT, env.OPENSEARCH_ABSTRACT_INDEX, settings)
 
 
-def fill_index():
-    # Load Data
-    with open(env.ABSTRACTS_DATASET_PATH, 'r') as f:
-        documents = json.load(f)['documents']
+def fill_index(index_name):
+    number_of_documents = dataset_io.count_documents(env.ABSTRACTS_DATASET_PATH)
 
-    # Ingest data using the bulk api
-    print(f"[{datetime.datetime.now()}] Inserting data into index {env.OPENSEARCH_ABSTRACT_INDEX}...")
-    generator = _bulk_data(documents, env.OPENSEARCH_ABSTRACT_INDEX)
-    nb_inserted, errors = helpers.bulk(OPENSEARCH_CLIENT, generator, chunk_size=64, max_retries=2, timeout=60)
+    # Stream the data into the index using concurrent bulk requests
+    print(f"[{datetime.datetime.now()}] Inserting data into index {index_name}...")
+    progress = tqdm(total=number_of_documents, file=sys.stdout)
+    with bulk_load_mode(OPENSEARCH_CLIENT, index_name) if env.BULK_LOAD_MODE else contextlib.nullcontext():
+        with BulkLoader(OPENSEARCH_CLIENT, progress=progress.update) as loader:
+            for documents in dataset_io.iter_document_batches(env.ABSTRACTS_DATASET_PATH,
+                                                              batch_size=env.INGEST_BATCH_SIZE):
+                loader.add(serialize_bulk_data(OPENSEARCH_CLIENT, add_content_hashes(documents), index_name,
+                                               id_field="pmid"))
+    progress.close()
+    loader.report()
 
-    if nb_inserted != len(documents):
-        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{len(documents)} fragments.")
-        print(f"[{datetime.datetime.now()}] See console output above and below for error details.")
+    nb_inserted, errors = loader.inserted, loader.errors
+    if nb_inserted != number_of_documents:
+        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{number_of_documents} abstracts.")
+        print(f"[{datetime.datetime.now()}] Errors: {errors}")
     else:
-        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{len(documents)} fragments.")
+        print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{number_of_documents} abstracts.")
         print(f"[{datetime.datetime.now()}] {f'Errors: {errors}' if len(errors) > 0 else 'No errors.'}")
+    return number_of_documents
+
+
+def update_fill_index():
+    """
+    Incrementally update the live index: only new or changed abstracts are (re-)indexed, removed ones are deleted.
+    """
+    update_index(
+        OPENSEARCH_CLIENT,
+        env.OPENSEARCH_ABSTRACT_INDEX,
+        dataset_io.iter_document_batches(env.ABSTRACTS_DATASET_PATH, batch_size=env.INGEST_BATCH_SIZE),
+        id_field="pmid",
+    )
 
 
 if __name__ == "__main__":
-    # Configure Ingest Pipeline and Index
+    parser = argparse.ArgumentParser(description="Ingest the abstracts into OpenSearch.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only index new or changed abstracts into the live index instead of rebuilding it.")
+    args = parser.parse_args()
+
+    # Configure Ingest Pipeline
     ingest_pipeline_id = insert_ingest_pipeline()
-    insert_index(ingest_pipeline_id)
 
-    # Fill Index
-    fill_index()
+    if args.incremental:
+        update_fill_index()
+    else:
+        # Configure and fill a new version of the Index
+        index_name = insert_index(ingest_pipeline_id)
+        number_of_documents = fill_index(index_name)
+
+        # Switch the alias to the new index
+        index_versioning.publish_index(OPENSEARCH_CLIENT, env.OPENSEARCH_ABSTRACT_INDEX, index_name, number_of_documents)
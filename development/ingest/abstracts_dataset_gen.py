@@ -1,29 +1,27 @@
 import datetime
-import json
-import os
 import sys
 
 from tqdm import tqdm
 
+import development.commons.dataset_io as dataset_io
 import development.commons.env as env
 
 
 def load_dataset():
     print(f"[{datetime.datetime.now()}] Loading Documents")
-    with open(env.CLEANED_DATASET_PATH, 'r') as input:
-        dataset = json.load(input)
-    return dataset
+    # Documents are streamed from disk while restructuring
+    return {
+        **dataset_io.load_metadata(env.INGEST_DATASET_PATH),
+        'documents': dataset_io.iter_documents(env.INGEST_DATASET_PATH),
+        'number_of_documents': dataset_io.count_documents(env.INGEST_DATASET_PATH),
+    }
 
 
 def restructure(dataset):
     print(f"[{datetime.datetime.now()}] Restructuring dataset...")
     documents = dataset["documents"]
-    abstracts = []
-
-    for document in tqdm(documents, total=len(documents), file=sys.stdout):
-        abstracts.append(document)
+    abstracts = tqdm(documents, total=dataset['number_of_documents'], file=sys.stdout)
 
-    print(f"[{datetime.datetime.now()}] Collected {len(abstracts)} abstracts from {len(documents)} documents")
     dataset = {
         'dataset_scraped_on': dataset['dataset_scraped_on'],
         'dataset_cleaned_on': dataset['dataset_cleaned_on'],
@@ -34,14 +32,9 @@ def restructure(dataset):
 
 
 def save_abstracts(abstracts):
-    # Ensure target folder exists
-    folder_path = os.path.dirname(env.ABSTRACTS_DATASET_PATH)
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    print(f"[{datetime.datetime.now()}] Saving Abstracts ({env.ABSTRACTS_DATASET_PATH})")
-    with open(env.ABSTRACTS_DATASET_PATH, 'w') as output:
-        json.dump(abstracts, output, indent=2, default=str)
+    # The documents are only consumed here, so the abstracts never have to be held in memory as a whole
+    print(f"[{datetime.datetime.now()}] Saving Abstracts ({dataset_io.dataset_path(env.ABSTRACTS_DATASET_PATH)})")
+    dataset_io.save_dataset(abstracts, env.ABSTRACTS_DATASET_PATH)
     print(f"[{datetime.datetime.now()}] Abstracts successfully saved!")
 
 
@@ -0,0 +1,211 @@
+import contextlib
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from opensearchpy.exceptions import TransportError
+
+import development.commons.env as env
+
+# ===== Constants =====
+BULK_LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": 0}
+INITIAL_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+REQUEST_TIMEOUT_SECONDS = 120
+FORCE_MERGE_TIMEOUT_SECONDS = 3600
+# ===== Constants =====
+
+
+def serialize_bulk_data(client, documents, index_name: str, id_field: str, op_type: str = "create"):
+    """
+    Serialize documents to the (action, source) line pairs of the bulk API.
+    """
+    serializer = client.transport.serializer
+    return [
+        (serializer.dumps({op_type: {"_index": index_name, "_id": doc[id_field]}}), serializer.dumps(doc))
+        for doc in documents
+    ]
+
+
+def serialize_bulk_deletes(client, ids, index_name: str):
+    serializer = client.transport.serializer
+    return [(serializer.dumps({"delete": {"_index": index_name, "_id": _id}}), None) for _id in ids]
+
+
+class BulkLoader:
+    """
+    Sends serialized documents to OpenSearch with several concurrent bulk requests.
+    Documents are grouped into chunks by size in bytes, not by count, so chunks of long abstracts and chunks of
+    short fragments put the same load on the cluster. Rejections (HTTP 429) are retried with exponential backoff,
+    and `add` blocks while all workers are busy, which slows the producer down instead of piling up chunks in memory.
+    """
+
+    def __init__(
+            self,
+            client,
+            workers: int = env.BULK_WORKERS,
+            max_chunk_bytes: int = env.BULK_CHUNK_BYTES,
+            max_retries: int = env.BULK_MAX_RETRIES,
+            progress=None,
+    ):
+        """
+        :param client: The OpenSearch client.
+        :param workers: The number of concurrent bulk requests.
+        :param max_chunk_bytes: The maximum size of the body of a bulk request.
+        :param max_retries: How often rejected documents are retried before they count as errors.
+        :param progress: Called with the number of documents of every finished chunk, e.g. `tqdm.update`.
+        """
+        self.client = client
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.progress = progress
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.futures = []
+
+        self.chunk = []
+        self.chunk_bytes = 0
+        self.documents = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.retries = 0
+        self.errors = []
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, serialized_documents, keep_together: bool = False):
+        """
+        Queue (action, source) line pairs for insertion. Full chunks are sent right away.
+        :param serialized_documents: The line pairs. The source is None for delete actions.
+        :param keep_together: Send all given actions in the same bulk request (unless they exceed a chunk on their own),
+        e.g. the new and the deleted fragments of one abstract.
+        """
+        sizes = [len(action) + (len(source) if source is not None else 0) + 2
+                 for action, source in serialized_documents]
+        if keep_together and len(self.chunk) > 0 and self.chunk_bytes + sum(sizes) > self.max_chunk_bytes:
+            self._submit()
+        for (action, source), size in zip(serialized_documents, sizes):
+            if not keep_together and len(self.chunk) > 0 and self.chunk_bytes + size > self.max_chunk_bytes:
+                self._submit()
+            self.chunk.append((action, source))
+            self.chunk_bytes += size
+
+    def _submit(self):
+        chunk = self.chunk
+        self.chunk = []
+        self.chunk_bytes = 0
+        self.documents += len(chunk)
+        # Backpressure: wait for a free slot instead of queueing an unbounded number of chunks
+        self.slots.acquire()
+        future = self.executor.submit(self._send_chunk, chunk)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def _send_chunk(self, chunk):
+        inserted = 0
+        errors = []
+        rejected = 0
+        retries = 0
+        backoff = INITIAL_BACKOFF_SECONDS
+
+        for attempt in range(self.max_retries + 1):
+            body = "".join(f"{action}\n" if source is None else f"{action}\n{source}\n" for action, source in chunk)
+            try:
+                response = self.client.bulk(body=body, request_timeout=REQUEST_TIMEOUT_SECONDS)
+                items = [next(iter(item.values())) for item in response["items"]]
+            except TransportError as e:
+                if e.status_code != 429:
+                    raise
+                # The whole request was rejected
+                items = [{"status": 429} for _ in chunk]
+
+            retry = []
+            for document, result in zip(chunk, items):
+                if result["status"] == 429:
+                    rejected += 1
+                    if attempt < self.max_retries:
+                        retry.append(document)
+                        continue
+                if "error" in result or result["status"] >= 300:
+                    errors.append(result)
+                else:
+                    inserted += 1
+
+            if len(retry) == 0:
+                break
+            chunk = retry
+            retries += 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+        with self.lock:
+            self.inserted += inserted
+            self.rejected += rejected
+            self.retries += retries
+            self.errors.extend(errors)
+        if self.progress is not None:
+            self.progress(inserted + len(errors))
+
+    def close(self):
+        """
+        Send the last chunk and wait until all requests finished.
+        :raises TransportError: If a bulk request failed for another reason than a rejection.
+        """
+        if len(self.chunk) > 0:
+            self._submit()
+        self.executor.shutdown(wait=True)
+        self.seconds = time.perf_counter() - self.start
+        for future in self.futures:
+            future.result()
+
+    def docs_per_second(self) -> float:
+        return self.inserted / self.seconds if self.seconds > 0 else float("inf")
+
+    def report(self):
+        print(f"[{datetime.datetime.now()}] Bulk load: {self.inserted}/{self.documents} documents in "
+              f"{self.seconds:.1f}s ({self.docs_per_second():.0f} docs/s), {self.rejected} rejected (429) documents, "
+              f"{self.retries} retried requests, {len(self.errors)} errors.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _current_settings(client, index_name: str, keys) -> dict:
+    response = client.indices.get_settings(index=index_name, flat_settings=True, include_defaults=True)[index_name]
+    settings = {**response.get("defaults", {}), **response["settings"]}
+    return {key: settings.get(key) for key in keys}
+
+
+@contextlib.contextmanager
+def bulk_load_mode(client, index_name: str):
+    """
+    Turn off refreshes and replicas of an index while it is loaded.
+    Afterwards, the previous settings are restored, the index is force-merged into one segment,
+    and the graphs of kNN fields are loaded into memory, so the first searches are not slow.
+    """
+    previous_settings = _current_settings(client, index_name, list(BULK_LOAD_SETTINGS) + ["index.knn"])
+    is_knn_index = str(previous_settings.pop("index.knn")).lower() == "true"
+
+    print(f"[{datetime.datetime.now()}] Switching index {index_name} to bulk-load settings {BULK_LOAD_SETTINGS}...")
+    client.indices.put_settings(index=index_name, body=BULK_LOAD_SETTINGS)
+    try:
+        yield
+    finally:
+        print(f"[{datetime.datetime.now()}] Restoring the settings {previous_settings} of index {index_name}...")
+        client.indices.put_settings(index=index_name, body=previous_settings)
+        client.indices.refresh(index=index_name)
+
+    print(f"[{datetime.datetime.now()}] Force-merging index {index_name}...")
+    start = time.perf_counter()
+    client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FORCE_MERGE_TIMEOUT_SECONDS)
+    print(f"[{datetime.datetime.now()}] Force-merge finished in {time.perf_counter() - start:.1f}s.")
+
+    if is_knn_index:
+        print(f"[{datetime.datetime.now()}] Warming up the kNN graphs of index {index_name}...")
+        warmup_result = client.transport.perform_request("GET", f"/_plugins/_knn/warmup/{index_name}")
+        print(f"[{datetime.datetime.now()}] Warmup result: {warmup_result}")
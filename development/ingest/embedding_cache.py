@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import development.commons.env as env
+
+# ===== Constants =====
+KEYS_FILE_NAME = "keys.bin"
+VECTORS_FILE_NAME = "vectors.f32"
+KEY_SIZE = 16  # bytes of the sha256 digest that are kept per entry
+VECTOR_DTYPE = np.float32
+# ===== Constants =====
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache for embeddings.
+    Every entry is keyed by the hash of (model name, text), so a changed text or a different model never hits
+    a stale vector. The vectors are stored in one append-only float32 file that is read through a memory map,
+    hence the cache does not have to fit into memory. The keys are stored in a second append-only file and are
+    written after their vectors, so an interrupted run never leaves a key without its vector behind.
+    """
+
+    def __init__(
+            self,
+            folder: str = env.EMBEDDING_CACHE_FOLDER_PATH,
+            model_name: str = env.EMBEDDING_MODEL_NAME,
+            dimension: int = env.EMBEDDING_DIMENSION,
+    ):
+        self.folder = folder
+        self.model_name = model_name
+        self.dimension = dimension
+        self.keys_path = os.path.join(folder, KEYS_FILE_NAME)
+        self.vectors_path = os.path.join(folder, VECTORS_FILE_NAME)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(folder, exist_ok=True)
+        self.rows = {}
+        self._vectors = None
+        self._load_keys()
+
+    def _load_keys(self):
+        keys = open(self.keys_path, "rb").read() if os.path.exists(self.keys_path) else b""
+        row_size = self.dimension * np.dtype(VECTOR_DTYPE).itemsize
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        vector_rows = vectors_size // row_size
+        # Only keys whose vector was completely written are valid
+        number_of_rows = min(len(keys) // KEY_SIZE, vector_rows)
+        self.rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(number_of_rows)}
+
+        # Drop the leftovers of an interrupted write, so that new entries are appended at the right row
+        if len(keys) != number_of_rows * KEY_SIZE:
+            with open(self.keys_path, "r+b") as output:
+                output.truncate(number_of_rows * KEY_SIZE)
+        if vectors_size != number_of_rows * row_size:
+            with open(self.vectors_path, "r+b") as output:
+                output.truncate(number_of_rows * row_size)
+
+    def _vector_map(self):
+        # Re-map the vector file lazily whenever entries were appended since the last mapping
+        if self._vectors is None or len(self._vectors) < len(self.rows):
+            self._vectors = np.memmap(self.vectors_path, dtype=VECTOR_DTYPE, mode="r",
+                                      shape=(len(self.rows), self.dimension))
+        return self._vectors
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()[:KEY_SIZE]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, texts: list[str]) -> tuple[list, list[int]]:
+        """
+        Look up the embeddings of the given texts.
+        :return: The embeddings (None for misses) and the indices of the missed texts.
+        """
+        with self.lock:
+            rows = [self.rows.get(self.key(text)) for text in texts]
+            vectors = self._vector_map() if len(self.rows) > 0 else None
+            missing = [i for i, row in enumerate(rows) if row is None]
+            # The pipeline threads look up concurrently, so the counters are only updated under the lock
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        embeddings = [None if row is None else np.array(vectors[row]) for row in rows]
+        return embeddings, missing
+
+    def add(self, texts: list[str], embeddings):
+        """
+        Append the embeddings of the given texts. Texts that are already cached are skipped.
+        """
+        with self.lock:
+            new_vectors = {}
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key not in self.rows and key not in new_vectors:
+                    new_vectors[key] = np.asarray(embedding, dtype=VECTOR_DTYPE)
+            if len(new_vectors) == 0:
+                return
+
+            with open(self.vectors_path, "ab") as output:
+                output.write(np.stack(list(new_vectors.values())).tobytes())
+            with open(self.keys_path, "ab") as output:
+                output.write(b"".join(new_vectors))
+            for key in new_vectors:
+                self.rows[key] = len(self.rows)
@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import development.commons.env as env
+
+# ===== Constants =====
+MAX_SEQUENCE_LENGTH = 512  # BERT models truncate longer inputs anyway
+MAX_BATCH_SIZE = 256
+BATCHES_PER_WORKER = 4  # batches queued per worker by one `encode` call, so no worker waits for the slowest batch
+_WORKER_MODEL = None  # the model of a worker process, loaded once by `_init_worker`
+# ===== Constants =====
+
+
+def _init_worker(model_name: str, threads: int):
+    global _WORKER_MODEL
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Pin the number of intra-op threads, so that the workers do not oversubscribe the cores
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_batch(texts: list[str]) -> np.ndarray:
+    return _WORKER_MODEL.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+def create_batches(lengths: list[int], token_budget: int, max_batch_size: int = MAX_BATCH_SIZE) -> list[list[int]]:
+    """
+    Group inputs into batches of similar token length.
+    The inputs are sorted by length, so padding to the longest input of a batch wastes few tokens. A batch grows
+    until its padded size (batch size * longest input) would exceed the token budget, hence short inputs are
+    encoded in large batches and long inputs in small ones.
+    :param lengths: The token length of every input.
+    :param token_budget: The maximum number of (padded) tokens per batch.
+    :param max_batch_size: The maximum number of inputs per batch.
+    :return: Batches of input indices.
+    """
+    batches = []
+    batch = []
+    for index in np.argsort(lengths, kind="stable"):
+        padded_length = max(lengths[index], 1)
+        if len(batch) > 0 and (
+                (len(batch) + 1) * padded_length > token_budget or len(batch) == max_batch_size):
+            batches.append(batch)
+            batch = []
+        batch.append(int(index))
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+
+class CpuEmbeddingEngine:
+    """
+    Encodes texts with a pool of worker processes on the CPU. Every worker holds its own copy of the model and
+    uses a fixed number of threads, so all cores are busy without oversubscription. The results are returned
+    in input order and match `SentenceTransformer.encode`.
+    """
+
+    def __init__(
+            self,
+            model_name: str = env.EMBEDDING_MODEL_NAME,
+            workers: int = env.EMBEDDING_WORKERS,
+            threads_per_worker: int = None,
+            token_budget: int = env.EMBEDDING_TOKEN_BUDGET,
+    ):
+        """
+        :param model_name: The name of the SentenceTransformer model.
+        :param workers: The number of worker processes.
+        :param threads_per_worker: The number of torch threads per worker. Defaults to the cores per worker.
+        :param token_budget: The maximum number of (padded) tokens per batch.
+        """
+        from transformers import AutoTokenizer
+
+        self.name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.token_budget = token_budget
+        self.device = f"cpu ({workers} workers x {self.threads_per_worker} threads)"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Spawn the workers, since forking a process that already initialized torch can deadlock
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, self.threads_per_worker),
+        )
+
+    def token_lengths(self, texts: list[str]) -> list[int]:
+        input_ids = self.tokenizer(texts, add_special_tokens=True, truncation=True,
+                                   max_length=MAX_SEQUENCE_LENGTH)["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    def input_batch_size(self, tokens_per_text: int = env.TOKENS_PER_FRAGMENT) -> int:
+        """
+        The number of texts one `encode` call needs to keep every worker busy. `encode` waits for its slowest batch,
+        so every worker should receive several batches of the token budget per call.
+        :param tokens_per_text: The typical token length of a text.
+        """
+        return max(MAX_BATCH_SIZE, self.workers * BATCHES_PER_WORKER * self.token_budget // tokens_per_text)
+
+    def encode(self, texts: list[str], batch_size: int = MAX_BATCH_SIZE) -> np.ndarray:
+        """
+        Encode the texts in parallel.
+        :param texts: The texts to encode.
+        :param batch_size: The maximum number of texts per batch, the token budget usually limits it further.
+        :return: The embeddings in input order.
+        """
+        if len(texts) == 0:
+            return np.empty((0, env.EMBEDDING_DIMENSION), dtype=np.float32)
+
+        batches = create_batches(self.token_lengths(texts), self.token_budget, batch_size)
+        embeddings = None
+        batch_results = self.executor.map(_encode_batch, [[texts[i] for i in batch] for batch in batches])
+        for batch, batch_embeddings in zip(batches, batch_results):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        return embeddings
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import development.commons.env as env
+
+# ===== Constants =====
+TEXTS_PER_TASK = 1000
+_WORKER_TOKENIZER = None  # the tokenizer of a worker process, loaded once by `_init_worker`
+# ===== Constants =====
+
+
+def _load_tokenizer(model_name: str):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    # Abstracts are longer than the model input, but they are only split here, never fed to the model
+    tokenizer.model_max_length = int(1e9)
+    return tokenizer
+
+
+def _init_worker(model_name: str):
+    global _WORKER_TOKENIZER
+    _WORKER_TOKENIZER = _load_tokenizer(model_name)
+
+
+def token_windows(number_of_tokens: int, tokens_per_fragment: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    The (start, end) token indices of the fragments. This mirrors the window loop of langchain's
+    `split_text_on_tokens`, so the fragment boundaries match the ones of `SentenceTransformersTokenTextSplitter`.
+    """
+    windows = []
+    start = 0
+    end = min(start + tokens_per_fragment, number_of_tokens)
+    while start < number_of_tokens:
+        windows.append((start, end))
+        start += tokens_per_fragment - overlap
+        end = min(start + tokens_per_fragment, number_of_tokens)
+    return windows
+
+
+def prune_tail_window(
+        windows: list[tuple[int, int]],
+        min_tail_tokens: int,
+        max_merged_tokens: int,
+) -> list[tuple[int, int]]:
+    """
+    Remove the redundancy of the last window: a tail that lies completely inside the overlap of its predecessor is
+    dropped, a tail shorter than `min_tail_tokens` is merged into its predecessor if the merged window has at most
+    `max_merged_tokens` tokens.
+    """
+    if len(windows) < 2:
+        return windows
+    (previous_start, previous_end), (start, end) = windows[-2], windows[-1]
+    if end <= previous_end:
+        return windows[:-1]
+    if end - start < min_tail_tokens and end - previous_start <= max_merged_tokens:
+        return windows[:-2] + [(previous_start, end)]
+    return windows
+
+
+def split_text_by_offsets(text: str, offsets, tokens_per_fragment: int, overlap: int, pruning=None) -> list[str]:
+    """
+    Cut a text into fragments by the character offsets of its tokens. The fragments are slices of the
+    original text, hence they keep its casing and spacing.
+    :param pruning: None, or the `min_tail_tokens` and `max_merged_tokens` of `prune_tail_window`.
+    """
+    windows = token_windows(len(offsets), tokens_per_fragment, overlap)
+    if pruning is not None:
+        windows = prune_tail_window(windows, *pruning)
+    return [text[offsets[start][0]:offsets[end - 1][1]] for start, end in windows]
+
+
+def _split_texts(texts: list[str], tokenizer, tokens_per_fragment: int, overlap: int, pruning) -> list[list[str]]:
+    encodings = tokenizer(
+        texts,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+    )
+    return [
+        split_text_by_offsets(text, offsets, tokens_per_fragment, overlap, pruning)
+        for text, offsets in zip(texts, encodings["offset_mapping"])
+    ]
+
+
+def _split_texts_in_worker(texts: list[str], tokens_per_fragment: int, overlap: int, pruning) -> list[list[str]]:
+    return _split_texts(texts, _WORKER_TOKENIZER, tokens_per_fragment, overlap, pruning)
+
+
+class FragmentSplitter:
+    """
+    Splits abstracts into overlapping token windows. The texts are tokenized in batches with the offset mapping of
+    the fast tokenizer, so no token is ever decoded back into text. With more than one worker, the batches are
+    split in a process pool. Unless pruning is disabled, the redundant tail fragment of an abstract is dropped or
+    merged (see `prune_tail_window`); without pruning the fragments match langchain's splitter.
+    """
+
+    def __init__(
+            self,
+            model_name: str = env.EMBEDDING_MODEL_NAME,
+            tokens_per_fragment: int = env.TOKENS_PER_FRAGMENT,
+            overlap: int = env.FRAGMENT_OVERLAP,
+            workers: int = env.SPLIT_WORKERS,
+            prune_tail_fragments: bool = env.PRUNE_TAIL_FRAGMENTS,
+            min_tail_tokens: int = env.MIN_TAIL_FRAGMENT_TOKENS,
+            max_merged_tokens: int = env.MAX_MERGED_FRAGMENT_TOKENS,
+    ):
+        if overlap >= tokens_per_fragment:
+            raise ValueError("The fragment overlap must be smaller than the number of tokens per fragment.")
+
+        self.model_name = model_name
+        self.tokens_per_fragment = tokens_per_fragment
+        self.overlap = overlap
+        self.workers = workers
+        self.pruning = (min_tail_tokens, max_merged_tokens) if prune_tail_fragments else None
+        self.tokenizer = _load_tokenizer(model_name) if workers <= 1 else None
+
+    def split_texts(self, texts: list[str]) -> list[list[str]]:
+        """
+        :return: The fragments of every text, in input order.
+        """
+        batches = [texts[i:i + TEXTS_PER_TASK] for i in range(0, len(texts), TEXTS_PER_TASK)]
+        if self.workers <= 1:
+            results = (_split_texts(batch, self.tokenizer, self.tokens_per_fragment, self.overlap, self.pruning)
+                       for batch in batches)
+        else:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.model_name,)) as executor:
+                results = list(executor.map(
+                    _split_texts_in_worker,
+                    batches,
+                    [self.tokens_per_fragment] * len(batches),
+                    [self.overlap] * len(batches),
+                    [self.pruning] * len(batches),
+                ))
+        return [fragments for batch_fragments in results for fragments in batch_fragments]
+
+    def split_text(self, text: str) -> list[str]:
+        return self.split_texts([text])[0]
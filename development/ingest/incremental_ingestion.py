@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import json
+
+from opensearchpy import helpers
+
+import development.commons.env as env
+from development.ingest.bulk_loader import BulkLoader, serialize_bulk_data, serialize_bulk_deletes
+
+# ===== Constants =====
+CONTENT_HASH_FIELD = "content_hash"
+# Fields that are derived from the content or set by OpenSearch, hence not part of the hash
+HASH_EXCLUDED_FIELDS = {CONTENT_HASH_FIELD, "ingested_at", "abstract_fragment_embedding"}
+SCAN_PAGE_SIZE = 5000
+# ===== Constants =====
+
+
+def content_hash(document: dict) -> str:
+    content = {key: value for key, value in document.items() if key not in HASH_EXCLUDED_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def add_content_hashes(documents: list[dict]) -> list[dict]:
+    for document in documents:
+        document[CONTENT_HASH_FIELD] = content_hash(document)
+    return documents
+
+
+def ensure_content_hash_mapping(client, index_name: str):
+    # Indices created before the checksums were introduced do not know the field (the mappings are strict)
+    client.indices.put_mapping(index=index_name, body={"properties": {CONTENT_HASH_FIELD: {"type": "keyword"}}})
+
+
+def load_index_hashes(client, index_name: str) -> dict[str, dict[str, str]]:
+    """
+    Read the content hashes of all documents in the index.
+    :return: The hash of every document id, grouped by pmid. Documents without a hash map to None.
+    """
+    hashes = {}
+    hits = helpers.scan(
+        client,
+        index=index_name,
+        query={"query": {"match_all": {}}},
+        _source_includes=["pmid", CONTENT_HASH_FIELD],
+        size=SCAN_PAGE_SIZE,
+    )
+    for hit in hits:
+        hashes.setdefault(str(hit["_source"]["pmid"]), {})[hit["_id"]] = hit["_source"].get(CONTENT_HASH_FIELD)
+    return hashes
+
+
+def iter_document_groups(document_batches):
+    """
+    Group a stream of document batches by pmid. The documents of one pmid (e.g. the fragments of an abstract)
+    must be consecutive, which holds for the datasets of the pipeline.
+    :yield: The pmid and its documents.
+    """
+    pmid = None
+    group = []
+    for documents in document_batches:
+        for document in documents:
+            if str(document["pmid"]) != pmid and len(group) > 0:
+                yield pmid, group
+                group = []
+            pmid = str(document["pmid"])
+            group.append(document)
+    if len(group) > 0:
+        yield pmid, group
+
+
+def update_index(
+        client,
+        index_name: str,
+        document_batches,
+        id_field: str,
+        prepare=None,
+        batch_size: int = env.INGEST_BATCH_SIZE,
+) -> dict:
+    """
+    Bring an index up to date with a dataset by only writing what changed.
+    The content hashes of the dataset are compared with the ones stored in the index, per pmid:
+    new and changed documents are (re-)indexed, documents that no longer exist are deleted. The new and the outdated
+    documents of a pmid (e.g. the fragments of a changed abstract) are sent in the same bulk request.
+    :param client: The OpenSearch client.
+    :param index_name: The index (or the alias of the index) to update.
+    :param document_batches: The dataset as stream of document batches, see `dataset_io.iter_document_batches`.
+    :param id_field: The field of the documents that is used as document id.
+    :param prepare: Called with every batch of new or changed documents before they are indexed, e.g. to embed them.
+    :param batch_size: The number of documents passed to `prepare` at once.
+    :return: The number of unchanged, new, changed and deleted pmids and the bulk errors.
+    """
+    ensure_content_hash_mapping(client, index_name)
+    print(f"[{datetime.datetime.now()}] Reading the content hashes of index {index_name}...")
+    indexed_hashes = load_index_hashes(client, index_name)
+    print(f"[{datetime.datetime.now()}] Found {len(indexed_hashes)} indexed pmids.")
+
+    statistics = {"unchanged": 0, "new": 0, "changed": 0, "deleted": 0}
+    pending = []
+
+    def flush():
+        documents = [document for group, _ in pending for document in group]
+        if prepare is not None and len(documents) > 0:
+            prepare(documents)
+        for group, outdated_ids in pending:
+            actions = serialize_bulk_data(client, group, index_name, id_field, op_type="index") if group else []
+            actions += serialize_bulk_deletes(client, outdated_ids, index_name)
+            loader.add(actions, keep_together=True)
+        pending.clear()
+
+    with BulkLoader(client) as loader:
+        for pmid, group in iter_document_groups(document_batches):
+            add_content_hashes(group)
+            hashes = {str(document[id_field]): document[CONTENT_HASH_FIELD] for document in group}
+            indexed = indexed_hashes.pop(pmid, None)
+            if indexed == hashes:
+                statistics["unchanged"] += 1
+                continue
+
+            statistics["new" if indexed is None else "changed"] += 1
+            # Only the documents whose content changed are prepared and re-indexed, e.g. the edited fragments
+            changed = [document for document in group
+                       if (indexed or {}).get(str(document[id_field])) != document[CONTENT_HASH_FIELD]]
+            outdated_ids = [_id for _id in (indexed or {}) if _id not in hashes]
+            pending.append((changed, outdated_ids))
+            if sum(len(changed) for changed, _ in pending) >= batch_size:
+                flush()
+        flush()
+
+        # Whatever is left in the index is no longer part of the dataset
+        for pmid, indexed in indexed_hashes.items():
+            loader.add(serialize_bulk_deletes(client, list(indexed), index_name), keep_together=True)
+            statistics["deleted"] += 1
+
+    loader.report()
+    print(f"[{datetime.datetime.now()}] Updated index {index_name}: {statistics['new']} new, "
+          f"{statistics['changed']} changed, {statistics['deleted']} deleted and "
+          f"{statistics['unchanged']} unchanged pmids.")
+    return {**statistics, "errors": loader.errors}
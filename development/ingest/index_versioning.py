@@ -0,0 +1,162 @@
+import datetime
+import re
+
+from opensearchpy.exceptions import NotFoundError
+
+import development.commons.env as env
+
+# ===== Constants =====
+VERSION_SEPARATOR = "_v"
+# ===== Constants =====
+
+
+def versioned_index_name(alias: str, version: int) -> str:
+    return f"{alias}{VERSION_SEPARATOR}{version}"
+
+
+def list_versions(client, alias: str) -> dict[int, str]:
+    """
+    Find all versioned indices (`<alias>_v<n>`) that belong to an alias.
+    :return: The index names by version.
+    """
+    indices = client.indices.get(index=f"{alias}{VERSION_SEPARATOR}*", allow_no_indices=True)
+    pattern = re.compile(rf"^{re.escape(alias)}{VERSION_SEPARATOR}(\d+)$")
+    versions = {}
+    for index_name in indices:
+        match = pattern.match(index_name)
+        if match:
+            versions[int(match.group(1))] = index_name
+    return versions
+
+
+def aliased_indices(client, alias: str) -> list[str]:
+    """
+    The indices the alias currently points to. Empty if the alias does not exist.
+    """
+    try:
+        return list(client.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def create_versioned_index(client, alias: str, body: dict) -> str:
+    """
+    Create the next version of the index behind an alias. The live index is not touched.
+    :return: The name of the new index.
+    """
+    versions = list_versions(client, alias)
+    index_name = versioned_index_name(alias, max(versions, default=0) + 1)
+
+    print(f"[{datetime.datetime.now()}] Configuring index {index_name}...")
+    configure_result = client.indices.create(index=index_name, body=body)
+    print(f"[{datetime.datetime.now()}] Configuration result: {configure_result}")
+    return index_name
+
+
+def verify_document_count(client, index_name: str, expected_count: int):
+    """
+    :raises RuntimeError: If the index does not contain the expected number of documents.
+    """
+    client.indices.refresh(index=index_name)
+    count = client.count(index=index_name)["count"]
+    if count != expected_count:
+        raise RuntimeError(f"Index {index_name} contains {count} instead of {expected_count} documents.")
+
+
+def mark_published(client, index_name: str):
+    """
+    Record in the mapping metadata of an index that it was verified and published,
+    so that only published versions count towards the retention.
+    """
+    client.indices.put_mapping(index=index_name, body={"_meta": {"published_on": str(datetime.datetime.now())}})
+
+
+def is_published(client, index_name: str) -> bool:
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    return "published_on" in mappings.get("_meta", {})
+
+
+def alias_actions(client, alias: str, index_name: str) -> list[dict]:
+    """
+    The alias actions that point the alias to the given index. A concrete index that still carries the name of
+    the alias (from before versioning) is removed by the same actions.
+    """
+    live_indices = aliased_indices(client, alias)
+    actions = [{"remove": {"index": index, "alias": alias}} for index in live_indices]
+    if len(live_indices) == 0 and client.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index_name, "alias": alias}})
+    return actions
+
+
+def swap_aliases(client, index_names: dict[str, str]):
+    """
+    Point every alias to its index in a single atomic request, so searches never see a missing index
+    and aliases that belong together never point to different versions.
+    :param index_names: The new index of every alias.
+    """
+    actions = [action for alias, index_name in index_names.items()
+               for action in alias_actions(client, alias, index_name)]
+
+    for alias, index_name in index_names.items():
+        print(f"[{datetime.datetime.now()}] Pointing alias {alias} to {index_name}...")
+    swap_result = client.indices.update_aliases(body={"actions": actions})
+    print(f"[{datetime.datetime.now()}] Alias result: {swap_result}")
+
+
+
+def collect_garbage(client, alias: str, retention: int = env.INDEX_RETENTION):
+    """
+    Delete old versions of the index. The newest `retention` published versions and the live index are kept,
+    so that a re-ingest can be rolled back by pointing the alias to a previous version.
+    Versions that were never published and are older than the live index are left over from aborted ingests
+    and are deleted as well; newer ones may still be filled and are kept.
+    """
+    live_indices = set(aliased_indices(client, alias))
+    versions = list_versions(client, alias)
+    live_versions = [version for version, index_name in versions.items() if index_name in live_indices]
+    published = [version for version in sorted(versions, reverse=True)
+                 if version in live_versions or is_published(client, versions[version])]
+
+    outdated = set(published[retention:])
+    outdated.update(version for version in versions
+                    if version not in published and version < max(live_versions, default=0))
+    for version in sorted(outdated):
+        index_name = versions[version]
+        if index_name in live_indices:
+            continue
+        print(f"[{datetime.datetime.now()}] Deleting old index {index_name}...")
+        client.indices.delete(index=index_name)
+
+
+def publish_indices(client, indices: dict[str, tuple[str, int]], retention: int = env.INDEX_RETENTION):
+    """
+    Verify freshly filled indices, switch all their aliases to them at once and delete outdated versions.
+    If any verification fails, none of the aliases is touched and all the new indices are deleted,
+    so indices that are filled together (e.g. abstracts and their fragments) are only published together.
+    :param indices: The new index name and its expected document count of every alias.
+    """
+    try:
+        for index_name, expected_count in indices.values():
+            verify_document_count(client, index_name, expected_count)
+    except RuntimeError as e:
+        print(f"[{datetime.datetime.now()}] Not publishing {[index_name for index_name, _ in indices.values()]}: {e}")
+        for index_name, _ in indices.values():
+            print(f"[{datetime.datetime.now()}] Deleting unverified index {index_name}...")
+            client.indices.delete(index=index_name)
+        return False
+
+    for index_name, _ in indices.values():
+        mark_published(client, index_name)
+    swap_aliases(client, {alias: index_name for alias, (index_name, _) in indices.items()})
+    for alias in indices:
+        collect_garbage(client, alias, retention)
+    return True
+
+
+def publish_index(client, alias: str, index_name: str, expected_count: int, retention: int = env.INDEX_RETENTION):
+    """
+    Verify a freshly filled index, switch the alias to it and delete outdated versions.
+    If the verification fails, the index is deleted and the alias keeps pointing to the previous index.
+    """
+    return publish_indices(client, {alias: (index_name, expected_count)}, retention)
@@ -0,0 +1,143 @@
+import datetime
+import queue
+import threading
+import time
+
+# ===== Constants =====
+_END_OF_STREAM = object()
+# ===== Constants =====
+
+
+class PipelineStage:
+    """
+    A single step of a `StreamingPipeline` that transforms one batch into another.
+    The stage keeps track of how much time it spent working and waiting, so that bottlenecks become visible.
+    """
+
+    def __init__(self, name: str, function, count=len):
+        """
+        :param name: The name of the stage used in the report.
+        :param function: Transforms an input batch into an output batch.
+        :param count: Returns the number of items (e.g. documents) of an input batch.
+        """
+        self.name = name
+        self.function = function
+        self.count = count
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+
+    def items_per_second(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else float("inf")
+
+
+class StreamingPipeline:
+    """
+    Runs a source and a chain of stages concurrently, each in its own thread, joined by bounded queues.
+    At most `queue_depth` batches wait between two stages, so peak memory only depends on the queue depth
+    and the batch size, not on the size of the dataset.
+    """
+
+    def __init__(self, source, stages: list[PipelineStage], queue_depth: int = 4):
+        """
+        :param source: An iterable of batches, e.g. a dataset that is streamed from disk.
+        :param stages: The stages in processing order. The outputs of the last stage are collected.
+        :param queue_depth: The maximum number of batches between two stages.
+        """
+        self.source = source
+        self.source_stage = PipelineStage("read", None)
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+        self.results = []
+        self.error = None
+
+    def _put(self, stage, output_queue, item):
+        start = time.perf_counter()
+        output_queue.put(item)
+        stage.output_wait_seconds += time.perf_counter() - start
+
+    def _run_source(self):
+        stage = self.source_stage
+        iterator = iter(self.source)
+        try:
+            while self.error is None:
+                start = time.perf_counter()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+                stage.busy_seconds += time.perf_counter() - start
+                stage.items += stage.count(batch)
+                stage.batches += 1
+                self._put(stage, self.queues[0], batch)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queues[0].put(_END_OF_STREAM)
+
+    def _run_stage(self, stage, input_queue, output_queue):
+        while True:
+            start = time.perf_counter()
+            batch = input_queue.get()
+            stage.input_wait_seconds += time.perf_counter() - start
+            if batch is _END_OF_STREAM:
+                break
+            if self.error is not None:
+                # Keep draining the input, so that upstream stages never block on a full queue
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = stage.function(batch)
+            except Exception as e:
+                self.error = e
+                continue
+            stage.busy_seconds += time.perf_counter() - start
+            stage.items += stage.count(batch)
+            stage.batches += 1
+
+            if output_queue is None:
+                self.results.append(result)
+            else:
+                self._put(stage, output_queue, result)
+
+        if output_queue is not None:
+            output_queue.put(_END_OF_STREAM)
+
+    def run(self) -> list:
+        """
+        Run the pipeline until the source is exhausted.
+        :return: The outputs of the last stage in order.
+        :raises Exception: The first exception raised by the source or any stage.
+        """
+        output_queues = self.queues[1:] + [None]
+        threads = [threading.Thread(target=self._run_source, daemon=True)]
+        threads += [
+            threading.Thread(target=self._run_stage, args=(stage, input_queue, output_queue), daemon=True)
+            for stage, input_queue, output_queue in zip(self.stages, self.queues, output_queues)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+    def report(self):
+        """
+        Print the throughput of every stage. The stage with the lowest items/s while busy is the bottleneck.
+        """
+        print(f"[{datetime.datetime.now()}] Pipeline finished in {self.wall_seconds:.1f}s:")
+        print(f"{'stage':<12}{'items':>10}{'batches':>9}{'busy (s)':>10}{'items/s':>10}"
+              f"{'input wait (s)':>16}{'output wait (s)':>17}")
+        for stage in [self.source_stage] + self.stages:
+            print(f"{stage.name:<12}{stage.items:>10}{stage.batches:>9}{stage.busy_seconds:>10.1f}"
+                  f"{stage.items_per_second():>10.0f}{stage.input_wait_seconds:>16.1f}"
+                  f"{stage.output_wait_seconds:>17.1f}")
@@ -0,0 +1,129 @@
+import sys
+import contextlib
+import datetime
+
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from tqdm import tqdm
+
+import development.commons.dataset_io as dataset_io
+import development.commons.env as env
+import development.commons.utils as utils
+import development.ingest.abstract_fragment_ingestor as abstract_fragment_ingestor
+import development.ingest.abstract_ingestor as abstract_ingestor
+import development.ingest.index_versioning as index_versioning
+from development.ingest.abstract_fragments_dataset_gen import create_fragment_documents
+from development.ingest.bulk_loader import BulkLoader, bulk_load_mode, serialize_bulk_data
+from development.ingest.embedding_cache import EmbeddingCache
+from development.ingest.embedding_engine import CpuEmbeddingEngine
+from development.ingest.fragment_splitter import FragmentSplitter
+from development.ingest.incremental_ingestion import add_content_hashes
+from development.ingest.ingest_pipeline import PipelineStage, StreamingPipeline
+
+# ===== Constants =====
+OPENSEARCH_CLIENT = utils.get_opensearch_client()
+# ===== Constants =====
+
+
+def split_abstracts(abstracts, splitter):
+    """
+    :return: The abstracts unchanged (they are indexed as they are in the ingest dataset) and their fragments.
+    """
+    split = splitter.split_texts([abstract['abstract'] for abstract in abstracts])
+    fragments = [
+        fragment
+        for abstract, abstract_fragments in zip(abstracts, split)
+        for fragment in create_fragment_documents(abstract, abstract_fragments)
+    ]
+    return abstracts, fragments
+
+
+def serialize_both(abstracts, fragments, abstract_index_name, fragment_index_name):
+    return (
+        serialize_bulk_data(OPENSEARCH_CLIENT, add_content_hashes(abstracts), abstract_index_name, id_field="pmid")
+        + serialize_bulk_data(OPENSEARCH_CLIENT, add_content_hashes(fragments), fragment_index_name, id_field="id")
+    )
+
+
+def fill_indices(abstract_index_name, fragment_index_name, batch_size=env.INGEST_BATCH_SIZE,
+                 queue_depth=env.INGEST_QUEUE_DEPTH):
+    """
+    Stream the ingest dataset (`INGEST_DATASET_PATH`) once through the stages read -> split -> embed -> serialize -> bulk and fill
+    the abstract and the fragment index in the same pass. No intermediate datasets are written.
+    :return: The number of abstracts and the number of fragments.
+    """
+    number_of_abstracts = dataset_io.count_documents(env.INGEST_DATASET_PATH)
+    splitter = FragmentSplitter(workers=1)  # the fast tokenizer already batches, the pipeline overlaps the stages
+    model = abstract_fragment_ingestor.load_embedding_model()
+    # Every abstract yields at least one fragment, so this many abstracts fill the embedding batches of the model
+    batch_size = abstract_fragment_ingestor.embedding_batch_size(model, batch_size)
+    cache = EmbeddingCache(model_name=model.name)
+    progress = tqdm(total=number_of_abstracts, file=sys.stdout, unit="abstracts")
+    loader = BulkLoader(OPENSEARCH_CLIENT)
+
+    def split(abstracts):
+        result = split_abstracts(abstracts, splitter)
+        progress.update(len(abstracts))
+        return result
+
+    def embed(batch):
+        abstracts, fragments = batch
+        return abstracts, abstract_fragment_ingestor.embed_abstract_fragments(fragments, model, cache)
+
+    def count_fragments(batch):
+        return len(batch[1])
+
+    pipeline = StreamingPipeline(
+        source=dataset_io.iter_document_batches(env.INGEST_DATASET_PATH, batch_size=batch_size),
+        stages=[
+            PipelineStage("split", split),
+            PipelineStage("embed", embed, count=count_fragments),
+            PipelineStage("serialize", lambda batch: serialize_both(
+                *batch, abstract_index_name, fragment_index_name), count=count_fragments),
+            PipelineStage("bulk", loader.add),
+        ],
+        queue_depth=queue_depth,
+    )
+
+    print(f"[{datetime.datetime.now()}] Splitting, embedding and inserting {number_of_abstracts} abstracts into "
+          f"{abstract_index_name} and {fragment_index_name} on device {model.device} in batches of {batch_size}...")
+    try:
+        with contextlib.ExitStack() as stack:
+            if env.BULK_LOAD_MODE:
+                stack.enter_context(bulk_load_mode(OPENSEARCH_CLIENT, abstract_index_name))
+                stack.enter_context(bulk_load_mode(OPENSEARCH_CLIENT, fragment_index_name))
+            with loader:
+                pipeline.run()
+    finally:
+        progress.close()
+        if isinstance(model, CpuEmbeddingEngine):
+            model.close()
+    pipeline.report()
+    loader.report()
+    print(f"[{datetime.datetime.now()}] Embedding cache: {cache.hits} hits, {cache.misses} misses "
+          f"({len(cache)} cached embeddings).")
+
+    number_of_fragments = pipeline.stages[1].items
+    nb_inserted, errors = loader.inserted, loader.errors
+    print(f"[{datetime.datetime.now()}] Ingested {nb_inserted}/{number_of_abstracts + number_of_fragments} "
+          f"abstracts and fragments.")
+    print(f"[{datetime.datetime.now()}] {f'Errors: {errors}' if len(errors) > 0 else 'No errors.'}")
+    return number_of_abstracts, number_of_fragments
+
+
+if __name__ == "__main__":
+    # Configure Ingest Pipelines
+    abstract_pipeline_id = abstract_ingestor.insert_ingest_pipeline()
+    fragment_pipeline_id = abstract_fragment_ingestor.insert_ingest_pipeline()
+
+    # Configure and fill new versions of both Indices
+    abstract_index_name = abstract_ingestor.insert_index(abstract_pipeline_id)
+    fragment_index_name = abstract_fragment_ingestor.insert_index(fragment_pipeline_id)
+    number_of_abstracts, number_of_fragments = fill_indices(abstract_index_name, fragment_index_name)
+
+    # Switch both aliases to the new indices at once, so they never serve different versions of the dataset
+    index_versioning.publish_indices(OPENSEARCH_CLIENT, {
+        env.OPENSEARCH_ABSTRACT_INDEX: (abstract_index_name, number_of_abstracts),
+        env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX: (fragment_index_name, number_of_fragments),
+    })
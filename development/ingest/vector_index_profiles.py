@@ -0,0 +1,150 @@
+import argparse
+import datetime
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from opensearchpy.exceptions import NotFoundError
+
+import development.commons.env as env
+import development.commons.utils as utils
+
+# ===== Constants =====
+# Named configurations of the kNN field. "method" is the method of the knn_vector mapping, "ef_search" the
+# query-time size of the candidate list of nmslib (an index setting). Profiles with "train" use a faiss model
+# that has to be trained on existing vectors first (see `train_model`).
+# Note: faiss in OpenSearch 2.11 supports no cosine space. Its profiles use l2, which ranks like cosine only for
+# normalized embeddings; check recall@k with the benchmark tool. NORMALIZE_EMBEDDINGS keeps the space of every
+# profile, so the OpenSearch scores (and the min-max normalized hybrid scores) stay the same.
+VECTOR_INDEX_PROFILES = {
+    # The original configuration: nmslib with its default graph parameters
+    "nmslib_hnsw": {
+        "method": {
+            "name": "hnsw",
+            "engine": "nmslib",
+            "space_type": "cosinesimil",
+            "parameters": {"m": 16, "ef_construction": 512},
+        },
+        "ef_search": 512,
+    },
+    "faiss_hnsw": {
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "space_type": "l2",
+            "parameters": {"m": 16, "ef_construction": 256, "ef_search": 256},
+        },
+    },
+    # Product quantization: 768 float32 (3072 bytes) are encoded into 96 sub-vectors of 8 bits (96 bytes)
+    "faiss_ivfpq": {
+        "method": {
+            "name": "ivf",
+            "engine": "faiss",
+            "space_type": "l2",
+            "parameters": {
+                "nlist": 1024,
+                "nprobes": 16,
+                "encoder": {"name": "pq", "parameters": {"m": 96, "code_size": 8}},
+            },
+        },
+        "train": True,
+    },
+}
+TRAINING_SAMPLE_SIZE = 50000
+TRAINING_POLL_SECONDS = 10
+# ===== Constants =====
+
+
+def get_profile(profile_name: str) -> dict:
+    if profile_name not in VECTOR_INDEX_PROFILES:
+        raise ValueError(f"Invalid vector index profile: {profile_name} (choose from {list(VECTOR_INDEX_PROFILES)})")
+    return VECTOR_INDEX_PROFILES[profile_name]
+
+
+def model_id(profile_name: str) -> str:
+    return f"{env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX}_{profile_name}"
+
+
+def knn_field_mapping(client, profile_name: str = env.VECTOR_INDEX_PROFILE) -> dict:
+    """
+    The mapping of the embedding field for a profile.
+    :raises ValueError: If the profile needs a trained model that does not exist yet.
+    """
+    profile = get_profile(profile_name)
+    if not profile.get("train"):
+        return {"type": "knn_vector", "dimension": env.EMBEDDING_DIMENSION, "method": profile["method"]}
+
+    if get_model_state(client, model_id(profile_name)) != "created":
+        raise ValueError(f"The profile {profile_name} needs a trained model. Train it with "
+                         f"`python development/ingest/vector_index_profiles.py train {profile_name}`.")
+    return {"type": "knn_vector", "model_id": model_id(profile_name)}
+
+
+def knn_index_settings(profile_name: str = env.VECTOR_INDEX_PROFILE) -> dict:
+    profile = get_profile(profile_name)
+    if "ef_search" in profile:
+        return {"index.knn.algo_param.ef_search": profile["ef_search"]}
+    return {}
+
+
+def get_model_state(client, knn_model_id: str):
+    try:
+        return client.transport.perform_request("GET", f"/_plugins/_knn/models/{knn_model_id}")["state"]
+    except NotFoundError:
+        return None
+
+
+def train_model(
+        client,
+        profile_name: str,
+        training_index: str = env.OPENSEARCH_ABSTRACT_FRAGMENT_INDEX,
+        training_field: str = "abstract_fragment_embedding",
+        max_training_vector_count: int = TRAINING_SAMPLE_SIZE,
+        knn_model_id: str = None,
+) -> str:
+    """
+    Train the faiss model of a profile on the vectors of an existing index (by default the live fragment index)
+    and wait until training finished. An existing model with the same id is replaced.
+    :return: The id of the model.
+    """
+    profile = get_profile(profile_name)
+    knn_model_id = knn_model_id or model_id(profile_name)
+    if get_model_state(client, knn_model_id) is not None:
+        client.transport.perform_request("DELETE", f"/_plugins/_knn/models/{knn_model_id}")
+
+    print(f"[{datetime.datetime.now()}] Training model {knn_model_id} on {training_index}.{training_field}...")
+    client.transport.perform_request("POST", f"/_plugins/_knn/models/{knn_model_id}/_train", body={
+        "training_index": training_index,
+        "training_field": training_field,
+        "dimension": env.EMBEDDING_DIMENSION,
+        "max_training_vector_count": max_training_vector_count,
+        "method": profile["method"],
+    })
+
+    while (state := get_model_state(client, knn_model_id)) == "training":
+        time.sleep(TRAINING_POLL_SECONDS)
+    if state != "created":
+        raise RuntimeError(f"Training of model {knn_model_id} failed (state: {state}).")
+    print(f"[{datetime.datetime.now()}] Model {knn_model_id} trained.")
+    return knn_model_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the vector index profiles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list")
+    train_parser = subparsers.add_parser("train", help="Train the model of a profile on the live fragment index.")
+    train_parser.add_argument("profile", choices=[name for name, p in VECTOR_INDEX_PROFILES.items() if p.get("train")])
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name, profile in VECTOR_INDEX_PROFILES.items():
+            print(f"{name}: {profile}")
+    else:
+        train_model(utils.get_opensearch_client(), args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,9 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 import numpy as np
+import development.commons.env as env
 import development.retrieve.opensearch_connector as oc
+from development.retrieve.query_context import QueryContext, query_context
 from development.retrieve.retrieval_wrapper import Document
 
 
@@ -13,23 +15,35 @@ PERFECT_CONFIDENCE_COS_SIM = 100
 CONFIDENCE_SCALING_FACTOR = 1.5
 
 
-def compute_confidence_ratings(query: str, texts: list[str]) -> list[int]:
+def compute_confidence_ratings(
+        query: str,
+        texts: list[str],
+        context: QueryContext = None,
+        vectors: list = None,
+) -> list[int]:
     """
     This function calculates the confidence rating of a query to a list of texts with cosine similarity.
 
     :param query: The query string.
     :param texts: A list of texts objects.
+    :param context: The query context of the request, which provides the query embedding.
+    :param vectors: The precomputed embeddings of the texts (e.g. the stored fragment embeddings), None for missing ones.
+    Only texts without a vector are encoded.
     :return: A list of confidence categories corresponding to each text.
     """
     if len(texts) == 0:
         return []
     
     # Compute Embeddings
-    abstract_embeddings = oc.MODEL.encode(texts)
-    query_embedding = oc.MODEL.encode(query)
+    abstract_embeddings = text_embeddings(texts, vectors)
+    query_embedding = query_context(query, context).embedding
 
     # Compute Distance
-    cosine_sim = cosine_similarity(query_embedding, abstract_embeddings)
+    if env.NORMALIZE_EMBEDDINGS:
+        # The embeddings have unit length: the cosine similarity is the dot product (clipped for arccos)
+        cosine_sim = np.clip(np.dot(abstract_embeddings, query_embedding), -1.0, 1.0)
+    else:
+        cosine_sim = cosine_similarity(query_embedding, abstract_embeddings)
     perc_dist = (np.pi - np.arccos(cosine_sim)) * 100 / np.pi
 
     # Compute Confidence
@@ -50,6 +64,23 @@ def compute_confidence_ratings(query: str, texts: list[str]) -> list[int]:
     return [int(x) for x in confidence]
 
 
+def text_embeddings(texts: list[str], vectors: list = None) -> np.ndarray:
+    """
+    The embeddings of the texts as one matrix. Given vectors are used as they are, the other texts are encoded
+    in one batch.
+    """
+    embeddings = list(vectors) if vectors is not None else [None] * len(texts)
+    if len(embeddings) != len(texts):
+        raise ValueError(f"Got {len(embeddings)} vectors for {len(texts)} texts.")
+
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None or len(embedding) == 0]
+    if len(missing) > 0:
+        encoded = oc.MODEL.encode([texts[i] for i in missing])
+        for i, embedding in zip(missing, encoded):
+            embeddings[i] = embedding
+    return np.asarray(embeddings, dtype=np.float32)
+
+
 def cosine_similarity(v1, vectors):
     """
     Calculates the cosine similarity between v1 and each vector in vectors.
@@ -1,16 +1,18 @@
 import json
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from development.commons.utils import get_opensearch_client
 from development.commons import env
-from sentence_transformers import SentenceTransformer
+from development.retrieve.query_context import MODEL, QueryContext, query_context
 
 
-MODEL = SentenceTransformer(env.EMBEDDING_MODEL_NAME)
 CLIENT = get_opensearch_client()
+MULTI_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=env.MULTI_QUERY_WORKERS)
 
 
 def execute_query(
@@ -58,6 +60,54 @@ def execute_query(
     )
 
 
+def execute_multi_query(
+        queries: list,
+        index: str = "abstracts",
+        source_includes: list[str] = None,
+        size: int = 5,
+        filter: dict[str, any] = None,
+        concurrent: bool = False,
+) -> tuple[list[dict[str, any]], list[float]]:
+    """
+    Execute several queries on the OpenSearch index in a single round trip.
+    By default, the queries are sent together in one msearch request. With `concurrent`, they are sent as separate
+    search requests at the same time over the connection pool of the client.
+    :param queries: The queries to execute.
+    :param index: The index to execute the queries on.
+    :param source_includes: The fields to include in the responses. If None, all fields are included.
+    :param size: The number of results to return per query.
+    :param filter: Restrict every query to documents that fulfill the filter criteria.
+    :param concurrent: Send concurrent search requests instead of one msearch request.
+    :return: The responses in the order of the queries and the time each query took in milliseconds
+    (as reported by OpenSearch for msearch, measured by the client for concurrent requests).
+    """
+    if filter and len(filter) > 0:
+        queries = [add_bool_filter_to_query(query, filter) for query in queries]
+
+    if concurrent:
+        def search(query):
+            start = time.perf_counter()
+            response = execute_query(query, index=index, source_includes=source_includes, size=size)
+            return response, (time.perf_counter() - start) * 1000
+
+        results = list(MULTI_QUERY_EXECUTOR.map(search, queries))
+        return [response for response, _ in results], [timing for _, timing in results]
+
+    body = []
+    for query in queries:
+        query_body = {"size": size, "query": query}
+        if source_includes:
+            query_body["_source"] = {"includes": source_includes}
+        body.extend([{"index": index}, query_body])
+
+    responses = CLIENT.msearch(body=body)["responses"]
+    for position, response in enumerate(responses):
+        if "error" in response:
+            # The query itself is not part of the message, a kNN query holds the whole query vector
+            raise RuntimeError(f"Query {position} of the multi-query failed: {response['error']}")
+    return responses, [float(response["took"]) for response in responses]
+
+
 def execute_hybrid_query(
         query,
         pipeline_weight: float = 0.0,
@@ -140,11 +190,15 @@ def create_multi_match_BM25_query(
     return {"multi_match": {"query": query_text, "fields": match_on_fields}}
 
 
-def create_knn_query(query_text: str, k: int = 10):
+def create_knn_query(query_text: str, k: int = 10, context: QueryContext = None):
+    """
+    :param context: The query context of the request. Its embedding is reused instead of encoding the text again.
+    """
     return {
         "knn": {
             "abstract_fragment_embedding": {
-                "vector": MODEL.encode(query_text).tolist(),
+                # numpy arrays are encoded by the client's serializer
+                "vector": query_context(query_text, context).embedding,
                 "k": k,
             }
         }
@@ -155,11 +209,12 @@ def create_hybrid_query(
         query_text: str,
         match_on_fields: list[str] = ["abstract_fragment", "title", "keyword_list"],
         knn_k: int = 10,
+        context: QueryContext = None,
 ):
     return {
         "hybrid": {
             "queries": [
-                create_knn_query(query_text, k=knn_k),
+                create_knn_query(query_text, k=knn_k, context=context),
                 create_multi_match_BM25_query(query_text, match_on_fields),
             ],
         }
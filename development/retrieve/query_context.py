@@ -0,0 +1,62 @@
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import numpy as np
+
+import development.commons.env as env
+from development.commons.embedding_backend import load_embedding_backend
+
+# ===== Constants =====
+MODEL = load_embedding_backend()
+# ===== Constants =====
+
+
+@lru_cache(maxsize=env.QUERY_EMBEDDING_CACHE_SIZE)
+def _encode_query(model, text: str) -> np.ndarray:
+    embedding = model.encode(text)
+    # The cached array is shared by all callers
+    embedding.setflags(write=False)
+    return embedding
+
+
+def encode_query(text: str, model=MODEL) -> np.ndarray:
+    """
+    Encode a query text. The embeddings are kept in a process-wide LRU cache keyed by model and text, so repeated
+    queries (e.g. the same question for every weight of an evaluation sweep) are encoded only once.
+    :return: The (read-only) query embedding.
+    """
+    return _encode_query(model, text)
+
+
+class QueryContext:
+    """
+    The state of one retrieval request that is shared by all of its steps (kNN and hybrid queries, fusion and
+    confidence scoring). The query embedding is computed on first use, at most once per request.
+    The steps record the time their OpenSearch queries took in `timings` (milliseconds by query name).
+    """
+
+    def __init__(self, text: str, model=MODEL):
+        self.text = text
+        self.model = model
+        self.timings = {}
+        self._embedding = None
+
+    @property
+    def embedding(self) -> np.ndarray:
+        if self._embedding is None:
+            self._embedding = encode_query(self.text, self.model)
+        return self._embedding
+
+
+def query_context(text: str, context: QueryContext = None) -> QueryContext:
+    """
+    :return: The given context, or a new one for the text. A given context must belong to the same text.
+    """
+    if context is None:
+        return QueryContext(text)
+    if context.text != text:
+        raise ValueError(f"The query context belongs to another query: {context.text}")
+    return context
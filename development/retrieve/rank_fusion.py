@@ -0,0 +1,91 @@
+import numpy as np
+
+# ===== Constants =====
+RRF_C = 60  # the constant of reciprocal rank fusion (as in langchain's EnsembleRetriever)
+FUSION_METHODS = ["rrf", "min_max", "z_score"]
+# ===== Constants =====
+
+
+def _normalized_scores(scores: np.ndarray, method: str) -> np.ndarray:
+    if method == "min_max":
+        score_range = scores.max() - scores.min()
+        return (scores - scores.min()) / score_range if score_range > 0 else np.ones_like(scores)
+    if method == "z_score":
+        deviation = scores.std()
+        return (scores - scores.mean()) / deviation if deviation > 0 else np.zeros_like(scores)
+    raise ValueError(f"Invalid fusion method: {method} (choose from {FUSION_METHODS})")
+
+
+def fuse(
+        ids: list[list[str]],
+        weights: list[float],
+        scores: list[np.ndarray] = None,
+        method: str = "rrf",
+        k: int = None,
+        c: int = RRF_C,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fuse several rankings into one. Every document contributes `weight * 1 / (rank + c)` per ranking for "rrf"
+    (ranks start at 1), or its weighted min-max or z-score normalized score for "min_max" and "z_score". The
+    contributions are summed in the order of the rankings, like langchain's `weighted_reciprocal_rank`, so the fused
+    scores are the same. Ties are broken by the first appearance of the documents (ranking by ranking), whereas
+    langchain breaks them in the arbitrary iteration order of a set.
+    :param ids: The document ids of every ranking, best first.
+    :param weights: The weight of every ranking.
+    :param scores: The scores of every ranking (required for "min_max" and "z_score").
+    :param method: One of `FUSION_METHODS`.
+    :param k: Only return the k best documents. If None, all documents are returned.
+    :param c: The constant of reciprocal rank fusion.
+    :return: The fused ids, their fused scores and, for every fused id, the index of its first appearance in the
+    concatenation of the rankings (to look up the original hit).
+    """
+    if len(ids) != len(weights):
+        raise ValueError("Number of rank lists must be equal to the number of weights.")
+    if method != "rrf" and scores is None:
+        raise ValueError(f"The fusion method {method} needs the scores of the rankings.")
+
+    lengths = np.array([len(ranking) for ranking in ids])
+    all_ids = np.array([_id for ranking in ids for _id in ranking], dtype=object)
+    if len(all_ids) == 0:
+        return np.array([], dtype=object), np.array([], dtype=np.float64), np.array([], dtype=np.int64)
+
+    if method == "rrf":
+        ranks = np.concatenate([np.arange(1, length + 1) for length in lengths])
+        contributions = np.repeat(np.asarray(weights, dtype=np.float64), lengths) * (1 / (ranks + c))
+    else:
+        contributions = np.concatenate([
+            weight * _normalized_scores(np.asarray(ranking_scores, dtype=np.float64), method)
+            for weight, ranking_scores in zip(weights, scores) if len(ranking_scores) > 0
+        ])
+
+    # Number the unique ids in order of their first appearance
+    unique_ids, first_indices, inverse = np.unique(all_ids.astype(str), return_index=True, return_inverse=True)
+    appearance_order = np.argsort(first_indices, kind="stable")
+    positions = np.empty_like(appearance_order)
+    positions[appearance_order] = np.arange(len(appearance_order))
+
+    fused_scores = np.zeros(len(unique_ids), dtype=np.float64)
+    np.add.at(fused_scores, positions[inverse.ravel()], contributions)
+
+    order = np.argsort(-fused_scores, kind="stable")[:k]
+    first_indices = first_indices[appearance_order]
+    return all_ids[first_indices[order]], fused_scores[order], first_indices[order]
+
+
+def fuse_hits(
+        hit_lists: list[list[dict]],
+        weights: list[float],
+        method: str = "rrf",
+        k: int = None,
+        c: int = RRF_C,
+) -> list[dict]:
+    """
+    Fuse the hits of several OpenSearch responses by their ids (see `fuse`).
+    :return: The fused hits, best first. A hit that appears in several responses is taken from the first one.
+    """
+    ids = [[hit["_id"] for hit in hits] for hits in hit_lists]
+    scores = [np.array([hit["_score"] for hit in hits], dtype=np.float64) for hits in hit_lists]
+    _, _, first_indices = fuse(ids, weights, scores if method != "rrf" else None, method=method, k=k, c=c)
+
+    all_hits = [hit for hits in hit_lists for hit in hits]
+    return [all_hits[index] for index in first_indices]
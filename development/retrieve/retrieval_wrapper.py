@@ -1,3 +1,4 @@
+import datetime
 import sys
 from pathlib import Path
 
@@ -8,7 +9,6 @@ from typing import Optional, List, Union, Literal
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain.retrievers import EnsembleRetriever
 
 
 from development.retrieve.opensearch_connector import (
@@ -16,8 +16,7 @@ from development.retrieve.opensearch_connector import (
     create_multi_match_BM25_query,
     create_hybrid_query,
     execute_hybrid_query,
-    create_term_query,
-    execute_query,
+    execute_multi_query,
     extract_hits_from_response,
     extract_source_from_hits,
 )
@@ -26,6 +25,8 @@ import development.commons.env as env
 from development.commons.utils import get_opensearch_client
 from development.retrieve.self_query import get_filters
 import development.retrieve.confidence_score as confidence_score
+import development.retrieve.rank_fusion as rank_fusion
+from development.retrieve.query_context import QueryContext, query_context
 
 
 CLIENT = get_opensearch_client()
@@ -64,7 +65,7 @@ class AbstractFragmentOpenSearch(BaseModel):
     ingested_at: str
     publication_date: str
     id: str
-    abstract_fragment_embedding: list[float]
+    abstract_fragment_embedding: Optional[list[float]] = None
     doi: str
 
     # not a part of the original response:
@@ -79,6 +80,7 @@ def retrieve_abstract_fragments(
     strategy: Literal[
         "reciprocal_rank_fusion", "opensearch_hybrid"
     ] = "reciprocal_rank_fusion",
+    context: QueryContext = None,
 ) -> list[AbstractFragmentOpenSearch]:
     """
     Retrieve a list of abstract fragments relevant to the given question.
@@ -86,8 +88,10 @@ def retrieve_abstract_fragments(
     :param amount: The number of abstract fragments to retrieve.
     :param self_query_retrieval: Whether to retrieve fragments using self-querying.
     :param strategy: Select by which strategy the hybrid search should work
+    :param context: The query context of the request (created if not given).
     :return: A list of AbstractFragmentOpenSearch.
     """
+    context = query_context(question, context)
 
     # Extract query filters for self-query retrieval
     filters = None
@@ -96,11 +100,11 @@ def retrieve_abstract_fragments(
 
     if strategy == "opensearch_hybrid":
         abstract_fragments = _retrieve_abstract_fragments_opensearch_hybrid_query(
-            question, filters, amount, NEURAL_WEIGHT
+            question, filters, amount, NEURAL_WEIGHT, context
         )
     elif strategy == "reciprocal_rank_fusion":
         abstract_fragments = _retrieve_abstract_fragments_reciprocal_rank_fusion(
-            question, filters, amount, NEURAL_WEIGHT
+            question, filters, amount, NEURAL_WEIGHT, context
         )
     else:
         raise ValueError(f"Invalid strategy: {strategy}")
@@ -112,7 +116,7 @@ def retrieve_abstract_fragments(
 
 
 def _retrieve_abstract_fragments_opensearch_hybrid_query(
-    question, filters, amount, weight
+    question, filters, amount, weight, context=None
 ) -> list[AbstractFragmentOpenSearch]:
     """
     Retrieve a list of abstract fragments relevant to the given question utilizing the opensearch hybrid query.
@@ -120,10 +124,11 @@ def _retrieve_abstract_fragments_opensearch_hybrid_query(
     :param filters: Restrict the query to documents that fulfill the filter criteria
     :param amount: The number of abstract fragments to retrieve.
     :param weight: The weight of the semantic part of the hybrid query. Must be between 0 and 1.
+    :param context: The query context of the request.
     :return: A list of AbstractFragmentOpenSearch.
     """
     query = create_hybrid_query(
-        query_text=question, match_on_fields=MATCH_ON_FIELDS, knn_k=amount
+        query_text=question, match_on_fields=MATCH_ON_FIELDS, knn_k=amount, context=context
     )
 
     # Send the query to OpenSearch via API
@@ -141,85 +146,76 @@ def _retrieve_abstract_fragments_opensearch_hybrid_query(
 
 
 def _retrieve_abstract_fragments_reciprocal_rank_fusion(
-    question, filters, amount, weight
+    question, filters, amount, weight, context=None
 ) -> list[AbstractFragmentOpenSearch]:
     """
     Retrieve a list of abstract fragments relevant to the given question utilizing a custom
-    hybrid query implementation that combines the ranks with reciprocal rank fusion.
+    hybrid query implementation that combines the ranks with reciprocal rank fusion
+    (or the score fusion configured in `RANK_FUSION_METHOD`).
     :param question: The question to retrieve abstract fragments for.
     :param filters: Restrict the query to documents that fulfill the filter criteria
     :param amount: The number of abstract fragments to retrieve.
     :param weight: The weight of the semantic part of the hybrid query. Must be between 0 and 1.
+    :param context: The query context of the request, receives the timings of the kNN and the BM25 query.
     :return: A list of AbstractFragmentOpenSearch.
     """
-    knn_query = create_knn_query(query_text=question, k=amount)
+    context = query_context(question, context)
+    knn_query = create_knn_query(query_text=question, k=amount, context=context)
     multi_match_query = create_multi_match_BM25_query(
         query_text=question, match_on_fields=MATCH_ON_FIELDS
     )
     queries = [knn_query, multi_match_query]
 
-    dummy_retriever = (
-        CustomOpensearchAbstractFragmentRetriever()
-    )  # This retriever is NOT used. It is only there because ensamle retriever needs a list of retrievers.
-    ensemble_retriever = EnsembleRetriever(
-        weights=[weight, 1 - weight], retrievers=[dummy_retriever, dummy_retriever]
+    # Send both queries to OpenSearch in one request
+    fragment_responses, timings = execute_multi_query(
+        queries=queries,
+        index=ABSTRACT_FRAGMENT_INDEX,
+        size=amount,
+        filter=filters,
+        concurrent=env.MULTI_QUERY_CONCURRENT,
     )
-
-    fragments_list = []
-    for query in queries:
-        # Send the query to OpenSearch via API
-        fragment_response = execute_query(
-            query=query,
-            index=ABSTRACT_FRAGMENT_INDEX,
-            size=amount,
-            filter=filters,
-        )
-        abstract_fragment_data = extract_source_from_hits(
-            extract_hits_from_response(fragment_response)
-        )
-        fragments = [
-            AbstractFragmentOpenSearch(**data) for data in abstract_fragment_data
-        ]
-        fragments = convert_abstract_fragments_to_langchain_documents(fragments)
-        fragments_list.append(fragments)
-
-    fragments = ensemble_retriever.weighted_reciprocal_rank(fragments_list)
-
-    return convert_langchain_documents_to_abstract_fragments(fragments)
+    context.timings.update(zip(["knn", "bm25"], timings))
+    print(f"[{datetime.datetime.now()}] Rank fusion sub-queries: kNN {timings[0]:.0f} ms, BM25 {timings[1]:.0f} ms")
+
+    # Fuse the rankings on the raw hits; only the fused fragments are parsed
+    fused_hits = rank_fusion.fuse_hits(
+        [extract_hits_from_response(response) for response in fragment_responses],
+        weights=[weight, 1 - weight],
+        method=env.RANK_FUSION_METHOD,
+    )
+    return [
+        AbstractFragmentOpenSearch(**data)
+        for data in extract_source_from_hits(fused_hits)
+    ]
 
 
-def retrieve_abstracts_from_pmids(pmids: list[str]) -> list[AbstractOpenSearch]:
+def retrieve_abstracts_from_pmids(
+    pmids: list[str], skip_missing: bool = False
+) -> list[AbstractOpenSearch]:
     """
-    Retrieve a list of abstracts for a given list of pmids from OpenSearch
+    Retrieve a list of abstracts for a given list of pmids from OpenSearch with a single multi-get request
+    (the abstracts are indexed with their pmid as id).
     :param pmids: A list of pmids.
-    :return: A list of Abstracts.
+    :param skip_missing: Leave out pmids without an abstract instead of raising an error.
+    :return: A list of Abstracts, in the order of the pmids.
+    :raises LookupError: If an abstract is missing and `skip_missing` is False.
     """
+    if len(pmids) == 0:
+        return []
 
-    # Construct term queries to retrieve each abstract
-    term_queries = [
-        create_term_query(match_key="pmid", match_value=pmid) for pmid in pmids
-    ]
+    response = CLIENT.mget(index=ABSTRACT_INDEX, body={"ids": pmids})
 
-    # Retrieve each abstract individually
+    # The documents of the response are in the order of the requested ids
     documents: list[AbstractOpenSearch] = []
-    for term_query in term_queries:
-        # Execute exact query
-        response = execute_query(
-            query=term_query,
-            index=ABSTRACT_INDEX,
-            size=1,
-        )
-
-        # Extract payload
-        hit = extract_hits_from_response(response)
-        data = extract_source_from_hits(hit)[0]
-
-        # Assert valid payload
-        if len(data) < 0:
-            TypeError(f"Could not retrieve document for pmid: {fragment_pmids[index]}")
-
-        # Parse to document structure
-        documents.append(AbstractOpenSearch(**data))
+    missing_pmids = []
+    for pmid, document in zip(pmids, response["docs"]):
+        if not document.get("found", False):
+            missing_pmids.append(pmid)
+            continue
+        documents.append(AbstractOpenSearch(**document["_source"]))
+
+    if len(missing_pmids) > 0 and not skip_missing:
+        raise LookupError(f"Could not retrieve the abstracts of the pmids: {missing_pmids}")
     return documents
 
 
@@ -304,8 +300,10 @@ class CustomOpensearchAbstractFragmentRetriever(BaseRetriever):
         self_query_retrieval: bool = False,
     ) -> List[Document]:
 
+        # The query is encoded once and shared by the retrieval and the confidence scoring
+        context = QueryContext(query)
         abstract_fragments = retrieve_abstract_fragments(
-            query, amount, self_query_retrieval
+            query, amount, self_query_retrieval, context=context
         )
 
         # Compute confidence ratings for each fragment
@@ -313,6 +311,8 @@ class CustomOpensearchAbstractFragmentRetriever(BaseRetriever):
             confidence_ratings = confidence_score.compute_confidence_ratings(
                 query=query,
                 texts=[fragment.abstract_fragment for fragment in abstract_fragments],
+                context=context,
+                vectors=[fragment.abstract_fragment_embedding for fragment in abstract_fragments],
             )
             # Assign confidence ratings to fragments
             for index, fragment in enumerate(abstract_fragments):
@@ -353,9 +353,10 @@ class CustomOpensearchAbstractRetriever(BaseRetriever):
         self_query_retrieval: bool = False,
     ) -> List[Document]:
 
-        # Retrieve abstract fragments
+        # Retrieve abstract fragments (the query is encoded once and shared with the confidence scoring)
+        context = QueryContext(query)
         abstract_fragments = retrieve_abstract_fragments(
-            query, amount * MAX_FRAGMENTS_PER_ABSTRACT, self_query_retrieval
+            query, amount * MAX_FRAGMENTS_PER_ABSTRACT, self_query_retrieval, context=context
         )
 
         # Filter out duplicate abstracts
@@ -365,7 +366,15 @@ class CustomOpensearchAbstractRetriever(BaseRetriever):
         unique_pmids = [fragment.pmid for fragment in top_k_unique_abstract_fragments]
 
         # Retrieve 'amount' abstracts from obtained pmids
-        abstracts = retrieve_abstracts_from_pmids(unique_pmids)
+        abstracts = retrieve_abstracts_from_pmids(unique_pmids, skip_missing=True)
+
+        # Keep the fragments aligned with the abstracts if an abstract is missing in the abstract index
+        found_pmids = {abstract.pmid for abstract in abstracts}
+        top_k_unique_abstract_fragments = [
+            fragment
+            for fragment in top_k_unique_abstract_fragments
+            if fragment.pmid in found_pmids
+        ]
 
         if calculate_confidence:
             confidence_ratings = confidence_score.compute_confidence_ratings(
@@ -374,6 +383,11 @@ class CustomOpensearchAbstractRetriever(BaseRetriever):
                     fragment.abstract_fragment
                     for fragment in top_k_unique_abstract_fragments
                 ],
+                context=context,
+                vectors=[
+                    fragment.abstract_fragment_embedding
+                    for fragment in top_k_unique_abstract_fragments
+                ],
             )
 
             # Assign confidence ratings to abstracts
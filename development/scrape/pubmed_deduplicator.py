@@ -0,0 +1,267 @@
+import datetime
+import json
+import os
+import re
+import sys
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+import development.commons.dataset_io as dataset_io
+import development.commons.env as env
+
+# ===== Constants =====
+SHINGLE_SIZE = 5  # words per shingle
+NUMBER_OF_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands of 8 rows: pairs above a Jaccard similarity of ~0.7 share a bucket with high probability
+SIGNATURES_PER_TASK = 1000
+MAX_PAIRWISE_BUCKET_SIZE = 64  # larger LSH buckets compare every member with the clusters of the bucket instead
+WORD_PATTERN = re.compile(r"\w+")
+RANDOM_SEED = 42
+# ===== Constants =====
+
+
+class MinHasher:
+    """
+    MinHash signatures of the word shingles of texts. The permutations are random multiply-shift hash functions on
+    the 32-bit hashes of the shingles, evaluated for all shingles of a text at once in numpy.
+    """
+
+    def __init__(self, number_of_permutations: int = NUMBER_OF_PERMUTATIONS, shingle_size: int = SHINGLE_SIZE,
+                 seed: int = RANDOM_SEED):
+        generator = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.multipliers = generator.integers(1, 2 ** 63, number_of_permutations, dtype=np.uint64) * 2 + 1
+        self.increments = generator.integers(0, 2 ** 63, number_of_permutations, dtype=np.uint64)
+        self.word_weights = generator.integers(1, 2 ** 31, shingle_size, dtype=np.uint64) * 2 + 1
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        """
+        The 32-bit hashes of the (lowercased) word shingles of a text.
+        """
+        words = WORD_PATTERN.findall(text.lower())
+        word_hashes = np.array([zlib.crc32(word.encode()) for word in words], dtype=np.uint64)
+        if len(word_hashes) == 0:
+            return word_hashes
+
+        # Texts shorter than a shingle are a single shingle
+        shingle_size = min(self.shingle_size, len(word_hashes))
+        number_of_shingles = len(word_hashes) - shingle_size + 1
+        hashes = np.zeros(number_of_shingles, dtype=np.uint64)
+        for offset, weight in enumerate(self.word_weights[:shingle_size]):
+            hashes += word_hashes[offset:offset + number_of_shingles] * weight
+        return np.unique(hashes & np.uint64(0xFFFFFFFF))
+
+    def signature(self, text: str):
+        """
+        :return: The signature (uint32 per permutation), or None if the text has no words.
+        """
+        hashes = self.shingle_hashes(text)
+        if len(hashes) == 0:
+            return None
+        permuted = (hashes[:, None] * self.multipliers[None, :] + self.increments[None, :]) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def _compute_signatures(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    hasher = MinHasher()
+    signatures = np.zeros((len(texts), NUMBER_OF_PERMUTATIONS), dtype=np.uint32)
+    has_words = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        signature = hasher.signature(text)
+        if signature is not None:
+            signatures[i] = signature
+            has_words[i] = True
+    return signatures, has_words
+
+
+def compute_signatures(json_path: str, folder: str, workers: int = env.DEDUPLICATION_WORKERS):
+    """
+    Compute the MinHash signatures of all abstracts of a dataset into a memory-mapped matrix, so only one batch of
+    abstracts is held in memory at a time.
+    :return: The pmids (int64), the signatures (memmap) and whether each abstract has any words.
+    """
+    number_of_documents = dataset_io.count_documents(json_path)
+    signatures = np.lib.format.open_memmap(
+        os.path.join(folder, "signatures.npy"), mode="w+", dtype=np.uint32,
+        shape=(number_of_documents, NUMBER_OF_PERMUTATIONS),
+    )
+    pmids = np.zeros(number_of_documents, dtype=np.int64)
+    has_words = np.zeros(number_of_documents, dtype=bool)
+
+    batches = dataset_io.iter_document_batches(json_path, columns=["pmid", "abstract"],
+                                               batch_size=SIGNATURES_PER_TASK)
+    progress = tqdm(total=number_of_documents, file=sys.stdout)
+    position = 0
+
+    def store(batch, result):
+        nonlocal position
+        batch_signatures, batch_has_words = result
+        end = position + len(batch)
+        pmids[position:end] = [int(document["pmid"]) for document in batch]
+        signatures[position:end] = batch_signatures
+        has_words[position:end] = batch_has_words
+        position = end
+        progress.update(len(batch))
+
+    if workers <= 1:
+        for batch in batches:
+            store(batch, _compute_signatures([document["abstract"] for document in batch]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Submit a bounded window of batches ahead, so memory does not grow with the corpus size
+            pending = []
+            for batch in batches:
+                pending.append((batch, executor.submit(_compute_signatures, [d["abstract"] for d in batch])))
+                if len(pending) >= workers * 2:
+                    store(*_resolve(pending.pop(0)))
+            while pending:
+                store(*_resolve(pending.pop(0)))
+    progress.close()
+    signatures.flush()
+    return pmids, signatures, has_words
+
+
+def _resolve(pending):
+    batch, future = pending
+    return batch, future.result()
+
+
+class UnionFind:
+    """
+    Disjoint sets of document positions. The root of every set is the document with the lowest pmid.
+    """
+
+    def __init__(self, pmids: np.ndarray):
+        self.pmids = pmids
+        self.parents = np.arange(len(pmids), dtype=np.int64)
+
+    def find(self, position: int) -> int:
+        root = position
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[position] != root:
+            self.parents[position], position = root, self.parents[position]
+        return int(root)
+
+    def union(self, first: int, second: int) -> bool:
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return False
+        if self.pmids[second] < self.pmids[first]:
+            first, second = second, first
+        self.parents[second] = first
+        return True
+
+
+def band_keys(signatures: np.ndarray, band: int, rows: int, chunk_size: int = 1000000) -> np.ndarray:
+    """
+    Hash the rows of one band of every signature into a 64-bit bucket key, chunk by chunk.
+    """
+    weights = np.random.default_rng(RANDOM_SEED + band).integers(1, 2 ** 63, rows, dtype=np.uint64) * 2 + 1
+    keys = np.zeros(len(signatures), dtype=np.uint64)
+    for start in range(0, len(signatures), chunk_size):
+        chunk = signatures[start:start + chunk_size, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys[start:start + chunk_size] = (chunk * weights).sum(axis=1)
+    return keys
+
+
+def find_duplicates(pmids, signatures, has_words, threshold: float = env.DEDUPLICATION_JACCARD_THRESHOLD,
+                    bands: int = LSH_BANDS) -> UnionFind:
+    """
+    Group near-duplicates with LSH: abstracts that share a bucket in any band are candidates, and two candidates are
+    merged if their estimated Jaccard similarity reaches the threshold. The members of small buckets are compared
+    pairwise, see `merge_bucket`.
+    """
+    rows = signatures.shape[1] // bands
+    clusters = UnionFind(pmids)
+    candidates = np.flatnonzero(has_words)
+
+    for band in tqdm(range(bands), file=sys.stdout):
+        keys = band_keys(signatures, band, rows)[candidates]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(sorted_keys)]))
+
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            merge_bucket(clusters, signatures, candidates[order[start:end]], threshold)
+    return clusters
+
+
+def merge_bucket(clusters: UnionFind, signatures: np.ndarray, members: np.ndarray, threshold: float):
+    """
+    Merge the near-duplicates among the members of one LSH bucket.
+    Small buckets are compared pairwise. In large buckets, every member is compared with the roots of the clusters
+    the bucket has formed so far and joins all the clusters it is similar to, which bounds the number of comparisons.
+    """
+    member_signatures = signatures[members]
+    if len(members) <= MAX_PAIRWISE_BUCKET_SIZE:
+        similarities = (member_signatures[:, None, :] == member_signatures[None, :, :]).mean(axis=2)
+        for first, second in zip(*np.nonzero(np.triu(similarities >= threshold, k=1))):
+            clusters.union(members[first], members[second])
+        return
+
+    roots = []
+    for member, member_signature in zip(members, member_signatures):
+        similar = []
+        if len(roots) > 0:
+            similarities = (signatures[roots] == member_signature).mean(axis=1)
+            similar = [root for root, similarity in zip(roots, similarities) if similarity >= threshold]
+        for root in similar:
+            clusters.union(member, root)
+        roots = sorted({clusters.find(root) for root in roots} | {clusters.find(member)})
+
+
+def deduplicate(json_path: str = env.CLEANED_DATASET_PATH, output_path: str = env.DEDUPLICATED_DATASET_PATH,
+                mapping_path: str = env.DUPLICATE_MAPPING_PATH, threshold: float = env.DEDUPLICATION_JACCARD_THRESHOLD):
+    """
+    Collapse near-duplicate abstracts into the one with the lowest pmid. The canonical abstracts are written to
+    the deduplicated dataset and every removed pmid is mapped to its canonical pmid.
+    :return: The number of documents and the number of removed duplicates.
+    """
+    output_folder = os.path.dirname(dataset_io.dataset_path(output_path)) or "."
+    os.makedirs(output_folder, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=output_folder) as folder:
+        print(f"[{datetime.datetime.now()}] Computing MinHash signatures ({NUMBER_OF_PERMUTATIONS} permutations, "
+              f"{SHINGLE_SIZE}-word shingles)...")
+        pmids, signatures, has_words = compute_signatures(json_path, folder)
+
+        print(f"[{datetime.datetime.now()}] Bucketing signatures into {LSH_BANDS} LSH bands "
+              f"(Jaccard threshold {threshold})...")
+        clusters = find_duplicates(pmids, signatures, has_words, threshold)
+        roots = np.array([clusters.find(position) for position in range(len(pmids))], dtype=np.int64)
+        del signatures
+
+    is_canonical = roots == np.arange(len(pmids))
+    mapping = {str(pmids[position]): str(pmids[roots[position]]) for position in np.flatnonzero(~is_canonical)}
+    with open(mapping_path, "w") as output:
+        json.dump(mapping, output, indent=2)
+
+    print(f"[{datetime.datetime.now()}] Saving {int(is_canonical.sum())} canonical abstracts...")
+    documents = (
+        document
+        for document, canonical in zip(dataset_io.iter_documents(json_path), is_canonical)
+        if canonical
+    )
+    dataset_io.save_dataset({
+        **dataset_io.load_metadata(json_path),
+        "dataset_deduplicated_on": datetime.datetime.now(),
+        "documents": documents,
+    }, output_path)
+
+    print(f"[{datetime.datetime.now()}] Removed {len(mapping)} near-duplicates of "
+          f"{len(set(mapping.values()))} abstracts ({len(pmids)} documents). Mapping saved to {mapping_path}")
+    return len(pmids), len(mapping)
+
+
+def main():
+    deduplicate()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
 import datetime
+import gzip
 import json
-import pickle
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
+from Bio import Entrez
 from tqdm import tqdm
 
+import development.commons.dataset_io as dataset_io
 import development.commons.env as env
+import development.scrape.pubmed_xml_extractor as pubmed_xml_extractor
+from development.scrape.raw_shard_store import RawShardStore
 
 # ===== Constants =====
 ABSTRACT_JOIN_SEPARATOR = "\n"
@@ -14,11 +19,15 @@ AUTHOR_NAME_SEPARATOR = " "
 
 
 def load_documents():
-    print(f"[{datetime.datetime.now()}] Loading 1.4GB of Documents ({env.RAW_DATASET_PATH})...")
-    with open(env.RAW_DATASET_PATH, "rb") as input:
-        documents = pickle.load(input)
-    print(f"[{datetime.datetime.now()}] Documents successfully loaded!")
-    return documents
+    # Shards are parsed lazily one at a time, so memory usage does not grow with the corpus size
+    store = RawShardStore()
+    print(f"[{datetime.datetime.now()}] Found {len(store.complete_keys())} shards of documents ({store.folder})")
+    if len(store.failed_keys()) > 0:
+        print(f"[{datetime.datetime.now()}] Skipping {len(store.failed_keys())} failed shards: {store.failed_keys()}")
+    return {
+        "shard_paths": store.shard_paths(),
+        "timestamp": store.scraped_on(),
+    }
 
 
 def is_missing_abstract(medium):
@@ -147,24 +156,54 @@ def extract_books(batch):
     return documents, books_without_abstract, books_without_authors
 
 
-def extract_relevant_information(data):
-    print(f"[{datetime.datetime.now()}] Extracting relevant information....")
+def extract_shard(path):
+    with gzip.open(path, "rb") as input:
+        batch = Entrez.read(input)
+
+    # Extract "Articles"
+    articles, articles_without_abstract, articles_without_author = extract_articles(batch)
+
+    # Extract "Books"
+    books, books_without_abstract, books_without_author = extract_books(batch)
+
+    return (articles + books,
+            articles_without_abstract + books_without_abstract,
+            articles_without_author + books_without_author)
+
+
+EXTRACTION_BACKENDS = {
+    "entrez": extract_shard,
+    "lxml": pubmed_xml_extractor.extract_shard,
+}
+
+
+def extract_shards(shard_paths, extract, workers):
+    """
+    Extract the shards one after another or in a process pool.
+    Shards are independent, so every worker extracts whole shards; the results are yielded in shard order.
+    """
+    if workers <= 1:
+        yield from map(extract, shard_paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(extract, shard_paths)
+
+
+def extract_relevant_information(data, backend=env.EXTRACTION_BACKEND, workers=env.EXTRACTION_WORKERS):
+    print(f"[{datetime.datetime.now()}] Extracting relevant information using the {backend} backend "
+          f"and {workers} worker(s)....")
+    extract = EXTRACTION_BACKENDS[backend]
     documents_without_abstract = 0
     documents_without_author = 0
     documents = []
 
-    for batch in tqdm(data["batched_data"], file=sys.stdout):
-        # Extract "Articles"
-        articles, articles_without_abstract, articles_without_author = extract_articles(batch)
-        documents.extend(articles)
-        documents_without_abstract += articles_without_abstract
-        documents_without_author += articles_without_author
-
-        # Extract "Books"
-        books, books_without_abstract, books_without_author = extract_books(batch)
-        documents.extend(books)
-        documents_without_abstract += books_without_abstract
-        documents_without_author += books_without_author
+    shard_results = extract_shards(data["shard_paths"], extract, workers)
+    for shard_documents, shard_without_abstract, shard_without_author in tqdm(
+            shard_results, total=len(data["shard_paths"]), file=sys.stdout):
+        documents.extend(shard_documents)
+        documents_without_abstract += shard_without_abstract
+        documents_without_author += shard_without_author
 
     print()
     print(f"[{datetime.datetime.now()}] Extraction Statistics:")
@@ -185,9 +224,8 @@ def extract_relevant_information(data):
 
 def save_extraction(extraction):
     print(f"[{datetime.datetime.now()}] Saving extracted relevant information...")
-    with open(env.CLEANED_DATASET_PATH, "w") as output:
-        json.dump(extraction, output, indent=2, default=str)
-    print(f"[{datetime.datetime.now()}] Information successfully saved to {env.CLEANED_DATASET_PATH}!")
+    path = dataset_io.save_dataset(extraction, env.CLEANED_DATASET_PATH)
+    print(f"[{datetime.datetime.now()}] Information successfully saved to {path}!")
 
 
 def main():
@@ -0,0 +1,169 @@
+import datetime
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from Bio import Entrez
+from tqdm import tqdm
+
+import development.commons.env as env
+from development.scrape.raw_shard_store import RawShardStore
+
+# ===== Constants =====
+TOOL_NAME = "pubmed_mlp_inlpt"
+REQUESTS_PER_SECOND_WITHOUT_API_KEY = 3  # NCBI limit per IP without an API key
+REQUESTS_PER_SECOND_WITH_API_KEY = 10  # NCBI limit per API key
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_TRIES = 5
+INITIAL_BACKOFF_SECONDS = 2.0
+REQUEST_TIMEOUT_SECONDS = 120
+# ===== Constants =====
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that limits the number of requests per second.
+    The bucket holds at most `capacity` tokens and is refilled at `rate` tokens per second. With the default
+    capacity of 1, requests are spaced by 1 / `rate` seconds, so no rolling second ever sees more than `rate`
+    requests (a larger capacity allows bursts on top of the rate).
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class EntrezClient:
+    """
+    Minimal E-utilities client that shares one rate limit between all threads and retries
+    transient failures (HTTP 429/5xx, connection errors) with exponential backoff.
+    The base url is configurable so that the client can run against a local stand-in server.
+    """
+
+    def __init__(
+            self,
+            base_url: str = env.ENTREZ_BASE_URL,
+            email: str = env.ENTREZ_EMAIL,
+            api_key: str = env.ENTREZ_API_KEY,
+            requests_per_second: float = env.ENTREZ_REQUESTS_PER_SECOND,
+    ):
+        if requests_per_second is None:
+            requests_per_second = REQUESTS_PER_SECOND_WITH_API_KEY if api_key else REQUESTS_PER_SECOND_WITHOUT_API_KEY
+
+        self.base_url = base_url.rstrip("/") + "/"
+        self.default_params = {"tool": TOOL_NAME, "email": email}
+        if api_key:
+            self.default_params["api_key"] = api_key
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.session = requests.Session()
+
+    def request(self, utility: str, **params) -> bytes:
+        """
+        Send a POST request to an E-utility (e.g. "efetch", "esearch") and return the raw response body.
+        :param utility: The name of the E-utility without the ".fcgi" suffix.
+        :param params: The parameters of the request.
+        :return: The raw response body.
+        """
+        url = f"{self.base_url}{utility}.fcgi"
+        data = {**self.default_params, **params}
+
+        backoff = INITIAL_BACKOFF_SECONDS
+        for attempt in range(1, MAX_TRIES + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(url, data=data, timeout=REQUEST_TIMEOUT_SECONDS)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.content
+                error = requests.HTTPError(f"HTTP {response.status_code} for {url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt == MAX_TRIES:
+                raise error
+            time.sleep(backoff)
+            backoff *= 2
+
+    def read(self, utility: str, **params):
+        """
+        Send a request to an E-utility and parse the XML answer with Bio.Entrez.
+        """
+        return Entrez.read(io.BytesIO(self.request(utility, **params)))
+
+
+def _fetch_batch(client, store, database, key, params):
+    try:
+        content = client.request("efetch", db=database, retmode="xml", **params)
+    except Exception as e:
+        store.mark_failed(key, params, e)
+        raise
+    store.write_shard(key, params, content)
+    return key
+
+
+def fetch_batches(
+        batches: dict[str, dict],
+        database: str,
+        client: EntrezClient = None,
+        store: RawShardStore = None,
+        max_workers: int = env.ENTREZ_MAX_WORKERS,
+        refetch: bool = False,
+):
+    """
+    Fetch efetch batches concurrently and write every finished batch as its own shard to the raw shard store.
+    Batches that are already complete in the store are skipped, so a crashed run resumes where it stopped.
+    Failed batches do not abort the run; they are marked in the manifest and reported once all other batches are done.
+    :param batches: Mapping from a stable batch key to the efetch parameters of that batch (e.g. {"id": "1,2,3"}).
+    :param database: The Entrez database to fetch from.
+    :param client: The Entrez client to use. Its rate limit is shared by all workers.
+    :param store: The raw shard store that receives one shard per finished batch.
+    :param max_workers: The number of concurrent requests.
+    :param refetch: Fetch the batches even if they are already complete in the store.
+    :raises RuntimeError: If at least one batch could not be fetched.
+    """
+    client = client or EntrezClient()
+    store = store or RawShardStore()
+
+    pending = {key: params for key, params in batches.items() if refetch or not store.is_complete(key)}
+    print(f"[{datetime.datetime.now()}] {len(batches) - len(pending)}/{len(batches)} batches already stored, "
+          f"fetching {len(pending)} batches with {max_workers} workers at "
+          f"{client.rate_limiter.rate} requests/s...")
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_fetch_batch, client, store, database, key, params): key
+            for key, params in pending.items()
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), file=sys.stdout):
+            try:
+                future.result()
+            except Exception as e:
+                failed[futures[future]] = e
+
+    if len(failed) > 0:
+        for key, error in failed.items():
+            print(f"[{datetime.datetime.now()}] Batch {key} failed: {error}")
+        raise RuntimeError(f"{len(failed)}/{len(batches)} batches failed. Re-run to fetch the missing batches.")
@@ -1,12 +1,10 @@
-import os
+import argparse
 import datetime
-import math
-import pickle
 
-from Bio import Entrez
-from tqdm import tqdm
+from pydantic import BaseModel
 
-import development.commons.env as env
+from development.scrape.pubmed_fetcher import EntrezClient, fetch_batches
+from development.scrape.raw_shard_store import RawShardStore
 
 # ===== Constants =====
 DATABASE_NAME = "pubmed"
@@ -14,81 +12,165 @@ ANSWER_FORMAT = "xml"
 SEARCH_TERM = "intelligence[Title/Abstract]"
 ID_BATCH_SIZE_LIMIT = 10000
 DOC_BATCH_SIZE_LIMIT = 1000
+DATE_FORMAT = "%Y/%m/%d"
 # ===== Constants =====
 
 
-def fetch_relevant_document_ids(start_year, end_year, checkpoints_per_year):
-    Entrez.email = 'benedikt.vidic@gmx.de'
-    relevant_ids = []
-
-    for checkpoint in range(0, (end_year - start_year) * checkpoints_per_year):
-        # Define time span
-        year = start_year + math.floor(checkpoint / checkpoints_per_year)
-        start_month = '01' if checkpoint % 2 == 0 else '07'
-        end_month = '06' if checkpoint % 2 == 0 else '12'
-
-        # Retrieve document handles for that time span
-        batch_result = Entrez.read(
-            Entrez.esearch(db=DATABASE_NAME,
-                           retstart=0,
-                           retmax=ID_BATCH_SIZE_LIMIT,  # 10000 ids per fetch is an api limit
-                           retmode=ANSWER_FORMAT,
-                           mindate=str(year) + '/' + start_month,
-                           maxdate=str(year) + '/' + end_month,
-                           term=SEARCH_TERM
-                           )
-        )
-
-        # Extract document ids
-        batch_ids = batch_result["IdList"]
-        print(f"Batch ID Count: {len(batch_ids)}")
-        relevant_ids += batch_ids
+class SearchWindow(BaseModel):
+    mindate: datetime.date
+    maxdate: datetime.date
+    count: int
+    webenv: str
+    query_key: str
+    ids: list[str] = []
+
+
+def create_initial_time_spans(start_year, end_year, checkpoints_per_year):
+    # Split every year into `checkpoints_per_year` consecutive, non-overlapping spans of days
+    time_spans = []
+    for year in range(start_year, end_year):
+        first_day = datetime.date(year, 1, 1)
+        days_in_year = (datetime.date(year + 1, 1, 1) - first_day).days
+        boundaries = [days_in_year * checkpoint // checkpoints_per_year for checkpoint in range(checkpoints_per_year + 1)]
+        for span_start, span_end in zip(boundaries, boundaries[1:]):
+            time_spans.append((first_day + datetime.timedelta(days=span_start),
+                               first_day + datetime.timedelta(days=span_end - 1)))
+    return time_spans
+
+
+def search_time_span(client, mindate, maxdate, with_ids=False):
+    # The hit count and a reference to the result on the history server, and optionally the first page of ids
+    result = client.read("esearch",
+                         db=DATABASE_NAME,
+                         term=SEARCH_TERM,
+                         mindate=mindate.strftime(DATE_FORMAT),
+                         maxdate=maxdate.strftime(DATE_FORMAT),
+                         usehistory="y",
+                         retmax=ID_BATCH_SIZE_LIMIT if with_ids else 0,  # 10000 ids per esearch is an api limit
+                         retmode=ANSWER_FORMAT)
+    return SearchWindow(mindate=mindate,
+                        maxdate=maxdate,
+                        count=int(result["Count"]),
+                        webenv=result["WebEnv"],
+                        query_key=result["QueryKey"],
+                        ids=list(result["IdList"]) if with_ids else [])
+
+
+def plan_search_windows(client, start_year, end_year, checkpoints_per_year):
+    """
+    Plan the search as a list of time windows whose results are stored on the Entrez history server.
+    Windows with more hits than the esearch/efetch cap of ID_BATCH_SIZE_LIMIT are split in half recursively,
+    so that no results are silently truncated. The ids of every window are returned by the same esearch request.
+    """
+    windows = []
+    time_spans = create_initial_time_spans(start_year, end_year, checkpoints_per_year)
+
+    while len(time_spans) > 0:
+        mindate, maxdate = time_spans.pop(0)
+        window = search_time_span(client, mindate, maxdate, with_ids=True)
+
+        if window.count <= ID_BATCH_SIZE_LIMIT:
+            print(f"Window {mindate} - {maxdate}: {window.count} documents")
+            if window.count > 0:
+                windows.append(window)
+        elif mindate == maxdate:
+            print(f"Window {mindate}: {window.count} documents exceed the limit of a single day, "
+                  f"only {ID_BATCH_SIZE_LIMIT} can be retrieved!")
+            windows.append(window)
+        else:
+            # Split the window in half and search both halves next
+            middle = mindate + (maxdate - mindate) // 2
+            time_spans[:0] = [(mindate, middle), (middle + datetime.timedelta(days=1), maxdate)]
+
+    print(f"Total Document Count: {sum(min(window.count, ID_BATCH_SIZE_LIMIT) for window in windows)} "
+          f"in {len(windows)} windows")
+    return windows
+
+
+def collect_relevant_document_ids(windows):
+    # Every planned window fits into a single esearch page, so the planning search already returned all its ids
+    relevant_ids = [pmid for window in windows for pmid in window.ids]
+    expected_count = sum(min(window.count, ID_BATCH_SIZE_LIMIT) for window in windows)
+    if len(relevant_ids) != expected_count:
+        print(f"Warning: esearch returned {len(relevant_ids)} ids for {expected_count} planned documents")
 
     print(f"Total ID Count: {len(relevant_ids)}")
     return relevant_ids
 
 
-def fetch_relevant_documents(relevant_document_ids):
-    relevant_documents = []
-    for index in tqdm(range(0, len(relevant_document_ids), DOC_BATCH_SIZE_LIMIT)):
-        batch_documents = Entrez.read(
-            Entrez.efetch(
-                db=DATABASE_NAME,
-                id=relevant_document_ids[index:index + DOC_BATCH_SIZE_LIMIT],
-                retmode=ANSWER_FORMAT
-            )
-        )
-        relevant_documents.append(batch_documents)
-    return relevant_documents
+def create_history_batches(windows):
+    # Every batch references its window on the history server, so no id lists have to be sent
+    batches = {}
+    for window in windows:
+        for retstart in range(0, min(window.count, ID_BATCH_SIZE_LIMIT), DOC_BATCH_SIZE_LIMIT):
+            # The count is part of the key, so a window whose results changed gets new shards instead of old checkpoints
+            key = f"window_{window.mindate:%Y%m%d}_{window.maxdate:%Y%m%d}_{window.count}_{retstart:05d}"
+            batches[key] = {
+                "WebEnv": window.webenv,
+                "query_key": window.query_key,
+                "retstart": retstart,
+                "retmax": DOC_BATCH_SIZE_LIMIT,
+            }
+    return batches
+
+
+def fetch_relevant_documents(client, store, windows):
+    # Batches are fetched concurrently and stored as shards, so an interrupted run can simply be restarted
+    batches = create_history_batches(windows)
+    # Shards of earlier plans are dropped, so they are not extracted together with the shards replacing them
+    store.set_plan(batches.keys())
+    fetch_batches(batches, DATABASE_NAME, client=client, store=store)
+
+
+def refetch_shard(client, store, key):
+    """
+    Re-fetch a single shard. History server references expire, so the window of the shard is searched again.
+    """
+    if not store.in_plan(key):
+        raise KeyError(f"Shard {key} is not part of the current plan")
+    _, mindate, maxdate, count, retstart = key.split("_")
+    window = search_time_span(client,
+                              datetime.datetime.strptime(mindate, "%Y%m%d").date(),
+                              datetime.datetime.strptime(maxdate, "%Y%m%d").date())
+    if window.count != int(count):
+        print(f"Warning: Window of shard {key} now has {window.count} instead of {count} documents. "
+              f"Consider a full re-run instead.")
+
+    batches = {key: {
+        "WebEnv": window.webenv,
+        "query_key": window.query_key,
+        "retstart": int(retstart),
+        "retmax": DOC_BATCH_SIZE_LIMIT,
+    }}
+    fetch_batches(batches, DATABASE_NAME, client=client, store=store, refetch=True)
 
 
-def save_relevant_documents(relevant_documents):
-    print("Saving Documents...")
-    folder_path = os.path.dirname(env.RAW_DATASET_PATH)
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    with open(env.RAW_DATASET_PATH, "wb") as output:
-        pickle.dump({
-            'batched_data': relevant_documents,
-            'timestamp': datetime.datetime.now()
-        }, output)
+def main():
+    parser = argparse.ArgumentParser(description="Scrape relevant PubMed documents into the raw shard store.")
+    parser.add_argument("--refetch", nargs="+", metavar="SHARD_KEY", help="Only re-fetch the given shards.")
+    args = parser.parse_args()
 
-    print("Documents successfully saved!")
+    client = EntrezClient()
+    store = RawShardStore()
 
+    if args.refetch:
+        for key in args.refetch:
+            refetch_shard(client, store, key)
+        return
 
-def main():
-    relevant_document_ids = fetch_relevant_document_ids(
+    windows = plan_search_windows(
+        client,
         start_year=2013,
         end_year=2024,
         checkpoints_per_year=2
     )
 
     # Assert ID uniqueness
+    relevant_document_ids = collect_relevant_document_ids(windows)
     assert len(relevant_document_ids) == len(set(relevant_document_ids))
 
-    relevant_documents = fetch_relevant_documents(relevant_document_ids)
-    save_relevant_documents(relevant_documents)
+    fetch_relevant_documents(client, store, windows)
+    print(f"Documents successfully saved to {store.folder}!")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+import datetime
+import gzip
+
+from lxml import etree
+
+# ===== Constants =====
+ABSTRACT_JOIN_SEPARATOR = "\n"
+AUTHOR_NAME_SEPARATOR = " "
+RECORD_TAGS = ("PubmedArticle", "PubmedBookArticle")
+# ===== Constants =====
+
+
+def inner_text(element):
+    """
+    Return the text of an element including inline markup (e.g. <i>, <sup>) as raw tags.
+    This is how Bio.Entrez represents mixed content, so both backends yield identical strings.
+    """
+    if element is None:
+        return ''
+    parts = [element.text or '']
+    for child in element:
+        attributes = "".join(f' {key}="{value}"' for key, value in child.attrib.items())
+        parts.append(f"<{child.tag}{attributes}>{inner_text(child)}</{child.tag}>")
+        parts.append(child.tail or '')
+    return "".join(parts)
+
+
+def extract_doi(article):
+    elocids = article.findall("ELocationID[@EIdType='doi']")
+    if len(elocids) == 0:
+        return ''
+    assert len(elocids) == 1
+    return inner_text(elocids[0])
+
+
+def extract_authors(author_list):
+    if author_list is None:
+        return []
+    return [AUTHOR_NAME_SEPARATOR.join(filter(lambda s: s != "", [
+        inner_text(author.find("ForeName")),
+        inner_text(author.find("LastName")),
+        inner_text(author.find("CollectiveName"))]))
+        for author in author_list.findall("Author")
+    ]
+
+
+def extract_publication_date(record):
+    newest_entry = record.findall("PubmedData/History/PubMedPubDate")[-1]
+    return datetime.datetime(
+        int(newest_entry.findtext("Year")),
+        int(newest_entry.findtext("Month")),
+        int(newest_entry.findtext("Day"))
+    ).date()
+
+
+def extract_article(record):
+    """
+    Extract a cleaned document from a <PubmedArticle> element.
+    :return: The cleaned document (None if the abstract is missing) and whether the authors are missing.
+    """
+    outer_article = record.find("MedlineCitation")
+    inner_article = outer_article.find("Article")
+
+    # Validate Article
+    abstract_texts = inner_article.findall("Abstract/AbstractText")
+    if len(abstract_texts) == 0:
+        return None, False
+    author_list = inner_article.find("AuthorList")
+    missing_author = author_list is None or len(author_list.findall("Author")) == 0
+
+    cleaned_article = {
+        "pmid": inner_text(outer_article.find("PMID")),
+        "doi": extract_doi(inner_article),
+        "title": inner_text(inner_article.find("ArticleTitle")),
+        "author_list": extract_authors(author_list),
+        "abstract": ABSTRACT_JOIN_SEPARATOR.join(inner_text(text) for text in abstract_texts),
+        "publication_date": extract_publication_date(record),
+        "keyword_list": [inner_text(keyword) for keyword in outer_article.findall("KeywordList/Keyword")],
+    }
+    return cleaned_article, missing_author
+
+
+def extract_shard(path):
+    """
+    Stream a gzip-compressed efetch shard with incremental parsing and extract the cleaned documents.
+    Every record element is discarded right after extraction, so memory usage stays flat.
+    The statistics match `pubmed_extractor.extract_shard`: book articles are counted as documents
+    without abstract, as `extract_books` looks for the abstract on the outer <PubmedBookArticle> element.
+    :param path: The path of the shard.
+    :return: The documents, the number of documents without abstract and the number of documents without authors.
+    """
+    documents = []
+    documents_without_abstract = 0
+    documents_without_authors = 0
+
+    with gzip.open(path, "rb") as input:
+        for _, record in etree.iterparse(input, events=("end",), tag=RECORD_TAGS, resolve_entities=False):
+            if record.tag == "PubmedBookArticle":
+                documents_without_abstract += 1
+            else:
+                document, missing_author = extract_article(record)
+                if document is None:
+                    documents_without_abstract += 1
+                else:
+                    documents.append(document)
+                    documents_without_authors += missing_author
+
+            # Free the processed record and its already processed siblings
+            record.clear()
+            while record.getprevious() is not None:
+                del record.getparent()[0]
+
+    return documents, documents_without_abstract, documents_without_authors
@@ -0,0 +1,120 @@
+import datetime
+import gzip
+import json
+import os
+import threading
+
+import development.commons.env as env
+
+# ===== Constants =====
+MANIFEST_FILE_NAME = "manifest.json"
+SHARD_SUFFIX = ".xml.gz"
+SHARD_COMPRESSION_LEVEL = 6
+STATUS_COMPLETE = "complete"
+STATUS_FAILED = "failed"
+# ===== Constants =====
+
+
+class RawShardStore:
+    """
+    On-disk store for the raw efetch answers. Every batch is written as its own gzip-compressed XML shard
+    and tracked in a manifest, so shards can be (re-)fetched individually and read back one at a time.
+    The manifest also records the shard keys of the current search plan; only those shards are read back.
+    """
+
+    def __init__(self, folder: str = env.RAW_SHARD_FOLDER_PATH):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+        self.lock = threading.Lock()
+
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as input:
+                self.manifest = json.load(input)
+        else:
+            self.manifest = {"created_on": str(datetime.datetime.now()), "updated_on": None, "plan": None, "shards": {}}
+        plan = self.manifest.get("plan")
+        self.plan = set(plan) if plan is not None else None
+
+    def shard_path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}{SHARD_SUFFIX}")
+
+    def in_plan(self, key: str) -> bool:
+        # Manifests written before plans were recorded accept every shard
+        return self.plan is None or key in self.plan
+
+    def set_plan(self, keys):
+        """
+        Record the shard keys of the current search plan. Shards of earlier plans, e.g. of windows whose hit count
+        changed or that were split differently, are removed from the manifest and deleted, so they are never read
+        back together with the shards that supersede them.
+        :param keys: The shard keys of the current plan.
+        """
+        plan = set(keys)
+        with self.lock:
+            superseded = [key for key in self.manifest["shards"] if key not in plan]
+            for key in superseded:
+                del self.manifest["shards"][key]
+                if os.path.exists(self.shard_path(key)):
+                    os.remove(self.shard_path(key))
+            self.plan = plan
+            self.manifest["plan"] = sorted(plan)
+            self._write_manifest()
+        if len(superseded) > 0:
+            print(f"[{datetime.datetime.now()}] Removed {len(superseded)} shards superseded by the current plan")
+
+    def is_complete(self, key: str) -> bool:
+        shard = self.manifest["shards"].get(key)
+        return shard is not None and shard["status"] == STATUS_COMPLETE and os.path.exists(self.shard_path(key))
+
+    def write_shard(self, key: str, params: dict, content: bytes):
+        """
+        Compress and write the raw XML of a batch, then mark it as complete in the manifest.
+        """
+        path = self.shard_path(key)
+        with open(path + ".tmp", "wb") as output:
+            output.write(gzip.compress(content, compresslevel=SHARD_COMPRESSION_LEVEL))
+        os.replace(path + ".tmp", path)
+
+        self._update_manifest(key, {
+            "file": os.path.basename(path),
+            "status": STATUS_COMPLETE,
+            "params": params,
+            "records": content.count(b"<PubmedArticle>") + content.count(b"<PubmedBookArticle>"),
+            "raw_bytes": len(content),
+            "fetched_on": str(datetime.datetime.now()),
+        })
+
+    def mark_failed(self, key: str, params: dict, error: Exception):
+        self._update_manifest(key, {
+            "file": None,
+            "status": STATUS_FAILED,
+            "params": params,
+            "error": str(error),
+            "fetched_on": str(datetime.datetime.now()),
+        })
+
+    def _update_manifest(self, key, entry):
+        with self.lock:
+            self.manifest["shards"][key] = entry
+            self._write_manifest()
+
+    def _write_manifest(self):
+        self.manifest["updated_on"] = str(datetime.datetime.now())
+        # Write to a temporary file first so that a crash never leaves a half-written manifest behind
+        with open(self.manifest_path + ".tmp", "w") as output:
+            json.dump(self.manifest, output, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def complete_keys(self) -> list[str]:
+        return sorted(key for key in self.manifest["shards"] if self.in_plan(key) and self.is_complete(key))
+
+    def failed_keys(self) -> list[str]:
+        return sorted(key for key, shard in self.manifest["shards"].items()
+                      if self.in_plan(key) and shard["status"] == STATUS_FAILED)
+
+    def scraped_on(self) -> str:
+        return self.manifest["updated_on"]
+
+    def shard_paths(self) -> list[str]:
+        return [self.shard_path(key) for key in self.complete_keys()]